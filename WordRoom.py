@@ -7,6 +7,7 @@ It contains all of the UI views and actions.
 import os.path
 import builtins
 import json
+import threading
 import webbrowser
 from urllib.parse import urlparse, unquote
 import ui
@@ -16,6 +17,7 @@ import console
 from jinja2 import Environment, FileSystemLoader
 from vocabulary import Vocabulary
 import define
+import prefetch
 from config import VOCABULARY_FILE, CONFIG_FILE, HTML_DIR, UI_DIR
 
 __author__ = 'John Jackson'
@@ -42,9 +44,17 @@ def load_word_view(word=''):
 
 
 def action_random(sender):
-    """Open a random word."""
+    """Open a random word.
+
+    This picks from the words with notes. If there aren't any yet, it picks
+    from the offline dictionary instead.
+    """
+    word = vocab.random_word() or define.random_word(min_definitions=2)
+    if word is None:
+        dialogs.hud_alert('No words to pick from.', icon='error')
+        return
     dialogs.hud_alert('Random word opened.')
-    load_word_view(vocab.random_word())
+    load_word_view(word)
 
 
 def export_notes_format(word, notes):
@@ -60,8 +70,7 @@ def action_share_multiple(sender):
     table = sender.superview.superview['table']
     words = []
     for row in table.selected_rows:
-        cell = vocab.tableview_cell_for_row(table, row[0], row[1])
-        word = cell.text_label.text
+        word = vocab.word_for_row(row[0], row[1])
         definition = vocab.get_notes(word)
         words.append(export_notes_format(word, definition))
     dialogs.share_text('\n\n----\n\n'.join(words))
@@ -262,6 +271,7 @@ class WordView(ui.View):
         d = define.define(word)
         html = template.render(**d)
         self['webcontainer']['html_definition'].load_html(html)
+        define.prefetch_links(d)
         if d['definitions'] and not vocab.get_notes(word):
             # only save the word to history if there are definitions for it
             row = vocab.set_word(word)
@@ -433,9 +443,7 @@ class TableViewDelegate:
             tableview.superview['editbar']['delete'].enabled = True
             tableview.superview['editbar']['share'].enabled = True
         else:
-            item = vocab.tableview_cell_for_row(tableview,
-                                                section, row)
-            load_word_view(item.text_label.text)
+            load_word_view(vocab.word_for_row(section, row))
 
     def tableview_did_deselect(self, tableview, section, row):
         """Call when the user deselects a table row."""
@@ -450,7 +458,8 @@ class WebDelegate:
     def webview_should_start_load(self, webview, url, nav_type):
         """Call when the user taps a link.
 
-        Links to suggested words will load in a fresh WordView.
+        Links to suggested or cross-referenced words will load in a fresh
+        WordView.
         Links to external sites will load in Safari.
         There's one special rule for changing the API key.
         """
@@ -500,6 +509,8 @@ class SearchDelegate:
     def textfield_did_change(self, textfield):
         """Search the vocabulary as the user types."""
         vocab.set_query(textfield.text)
+        vocab.set_completions(define.complete(vocab.query))
+        define.prewarm_for(vocab.query)
         if textfield.text.find('#') != -1:
             # Typing a #hashtag automaticaly activates fulltext search
             textfield.superview['segmentedcontrol1'].selected_index = 1
@@ -569,6 +580,13 @@ if __name__ == '__main__':
         container = AdaptiveView(lookup_view, word_view)
         container.name = 'WordRoom'
         container.present('fullscreen', hide_title_bar=True)
+        # Compiling the offline dictionary takes a few seconds, but it only
+        # happens the first time WordRoom runs or after the shards change.
+        threading.Thread(target=define.build_opted_binary, daemon=True).start()
+        define.start_prewarming(vocab.all_words())
+        # Definitions for rows the table shows are fetched in the background.
+        vocab.row_shown = lambda word: define.start_prefetching([word])
+        define.start_prefetching(vocab.recent_words(10), prefetch.RECENT)
         builtins.wordroom = (vocab, jinja2env, lookup_view, word_view,
                              compact_word_view, about_view, container)
     # if appex.is_running_extension():
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""This module finds anagrams of words and words that can be made from tiles.
+
+Only headwords made of the letters a to z (ignoring case and accents) are
+indexed, since those are the ones a word game can use. Each one is stored as
+a row of 26 letter counts. Exact anagrams share the same sorted letters, so
+they're found through a sorted array of signature hashes, like the one in
+`spelling`. "Sub-anagrams", the words that can be made from a rack of tiles,
+are the rows where no count is higher than the rack's. When numpy is
+available, that check runs over the whole matrix at once.
+
+Results are ranked by their Scrabble score, computed locally, so this never
+needs `WordApi.getScrabbleScore`.
+"""
+import bisect
+import heapq
+import mmap
+import struct
+import unicodedata
+import zlib
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'WRANAG01'
+HEADER = struct.Struct('<8sI')
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+# The tile values from the English edition of Scrabble
+SCORES = {'a': 1, 'b': 3, 'c': 3, 'd': 2, 'e': 1, 'f': 4, 'g': 2, 'h': 4,
+          'i': 1, 'j': 8, 'k': 5, 'l': 1, 'm': 3, 'n': 1, 'o': 1, 'p': 3,
+          'q': 10, 'r': 1, 's': 1, 't': 1, 'u': 1, 'v': 4, 'w': 4, 'x': 8,
+          'y': 4, 'z': 10}
+# Characters in a rack that stand for blank tiles
+BLANKS = '? _'
+
+
+def letters(word: str):
+    """Return a word folded to the letters a to z, or None if it can't be.
+
+    Case and accents are ignored, so "Café" becomes "cafe". Words with any
+    other characters, like spaces or hyphens, return None.
+    """
+    word = unicodedata.normalize('NFKD', word.casefold())
+    word = ''.join(c for c in word if not unicodedata.combining(c))
+    if word and all(c in SCORES for c in word):
+        return word
+    return None
+
+
+def signature(word: str):
+    """Return the sorted letters of a word, which all its anagrams share."""
+    return ''.join(sorted(word))
+
+
+def scrabble_score(word: str):
+    """Return the Scrabble score of a word, without any bonus squares.
+
+    This is the offline counterpart of `WordApi.getScrabbleScore`.
+    Characters that aren't letters score nothing.
+    """
+    folded = unicodedata.normalize('NFKD', word.casefold())
+    return sum(SCORES.get(c, 0) for c in folded)
+
+
+def _counts(word: str):
+    counts = bytearray(26)
+    for c in word:
+        counts[ord(c) - 97] = min(counts[ord(c) - 97] + 1, 255)
+    return counts
+
+
+def _mask(word: str):
+    mask = 0
+    for c in word:
+        mask |= 1 << (ord(c) - 97)
+    return mask
+
+
+def _hash(text: str):
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def compile_anagrams(words, dest: str):
+    """Build the anagram index for a sequence of headwords and save it.
+
+    Rows are sorted by word length, so a rack of tiles only has to check the
+    words that are short enough. The file holds, in native byte order:
+
+        ids      the headword id of each row
+        masks    a bit for each letter that a row's word uses
+        hashes   signature hashes in sorted order
+        rows     the row of each signature hash
+        scores   the Scrabble score of each row
+        lengths  the length of each row's word
+        matrix   26 letter counts for each row
+    """
+    entries = []
+    for i, word in enumerate(words):
+        folded = letters(word)
+        if folded:
+            entries.append((len(folded), i, folded))
+    entries.sort()
+    ids = array('I', (i for _, i, _ in entries))
+    masks = array('I', (_mask(w) for _, _, w in entries))
+    pairs = sorted(_hash(signature(w)) << 32 | row
+                   for row, (_, _, w) in enumerate(entries))
+    hashes = array('I', (pair >> 32 for pair in pairs))
+    rows = array('I', (pair & 0xffffffff for pair in pairs))
+    scores = array('H', (scrabble_score(w) for _, _, w in entries))
+    lengths = array('B', (min(n, 255) for n, _, _ in entries))
+    with open(dest, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries)))
+        for data in (ids, masks, hashes, rows, scores, lengths):
+            data.tofile(f)
+        for _, _, word in entries:
+            f.write(_counts(word))
+
+
+class AnagramIndex:
+    """Find anagrams and the words that can be made from a rack of tiles.
+
+    The file is memory-mapped, and the letter count matrix is used directly
+    as a numpy array if numpy is installed.
+    """
+
+    FILE = 'anagrams.bin'
+
+    def __init__(self, path: str):
+        """Open and map the given file."""
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError('%s is not an anagram index.' % path)
+        self.count = count
+        view = memoryview(self._map)[HEADER.size:]
+        words = view[:count * 16].cast('I')
+        self._ids = words[:count]
+        self._masks = words[count:count * 2]
+        self._hashes = words[count * 2:count * 3]
+        self._rows = words[count * 3:]
+        start = count * 16
+        self._scores = view[start:start + count * 2].cast('H')
+        self._lengths = view[start + count * 2:start + count * 3]
+        self._matrix = view[start + count * 3:start + count * 29]
+        if numpy is not None:
+            self._array = numpy.frombuffer(
+                self._matrix, dtype=numpy.uint8).reshape(count, 26)
+            self._score_array = numpy.frombuffer(self._scores,
+                                                 dtype=numpy.uint16)
+
+    def row(self, n: int):
+        """Return the 26 letter counts of a row."""
+        return self._matrix[n * 26:n * 26 + 26]
+
+    def anagrams(self, word: str):
+        """Return the headword ids that use exactly the letters of a word.
+
+        The word itself is included if it's a headword.
+        """
+        folded = letters(word)
+        if not folded:
+            return []
+        key = _hash(signature(folded))
+        counts = _counts(folded)
+        found = []
+        n = bisect.bisect_left(self._hashes, key)
+        while n < self.count and self._hashes[n] == key:
+            row = self._rows[n]
+            # Different signatures can share a hash, so check the counts.
+            if self.row(row) == counts:
+                found.append(self._ids[row])
+            n += 1
+        return sorted(found)
+
+    def _span(self, min_length: int, max_length: int):
+        """Return the (start, end) rows of words within a length range."""
+        return (bisect.bisect_left(self._lengths, min_length),
+                bisect.bisect_right(self._lengths, max_length))
+
+    def _scan_numpy(self, counts, blanks: int, start: int, end: int):
+        matrix = self._array[start:end]
+        rack = numpy.frombuffer(bytes(counts), dtype=numpy.uint8)
+        if blanks:
+            missing = numpy.clip(matrix.astype(numpy.int16) - rack, 0, None)
+            found = numpy.nonzero(missing.sum(axis=1) <= blanks)[0]
+            # Blank tiles score nothing, so subtract the letters they replace.
+            values = numpy.array([SCORES[c] for c in LETTERS])
+            lost = missing[found] @ values
+        else:
+            found = numpy.nonzero((matrix <= rack).all(axis=1))[0]
+            lost = 0
+        found += start
+        scores = self._score_array[found] - lost
+        return zip(found.tolist(), scores.tolist())
+
+    def _scan_python(self, counts, blanks: int, start: int, end: int):
+        rack_mask = _mask(c for c in LETTERS if counts[ord(c) - 97])
+        for n in range(start, end):
+            # Most words use a letter that isn't in the rack at all.
+            unused = self._masks[n] & ~rack_mask
+            if unused and bin(unused).count('1') > blanks:
+                continue
+            row = self.row(n)
+            lost = 0
+            short = 0
+            for c, (have, need) in enumerate(zip(counts, row)):
+                if need > have:
+                    short += need - have
+                    lost += (need - have) * SCORES[LETTERS[c]]
+            if short <= blanks:
+                yield n, self._scores[n] - lost
+
+    def from_tiles(self, tiles: str, min_length=2, limit=20):
+        """Return the headwords that can be spelled with a rack of tiles.
+
+        Each tile can only be used once, and `?`, `_` or a space stand for a
+        blank that can be any letter. Other characters that aren't letters
+        are ignored. The result is a list of `(id, score)` tuples, ranked by
+        score, then by length.
+        """
+        blanks = sum(tiles.count(c) for c in BLANKS)
+        # Tiles are folded one at a time, so a stray digit doesn't discard
+        # the whole rack.
+        folded = ''.join(letters(c) or '' for c in tiles if c not in BLANKS)
+        counts = _counts(folded)
+        start, end = self._span(min_length, len(folded) + blanks)
+        if start >= end:
+            return []
+        if numpy is not None:
+            found = self._scan_numpy(counts, blanks, start, end)
+        else:
+            found = self._scan_python(counts, blanks, start, end)
+        ranked = heapq.nsmallest(limit, found, key=lambda f: (
+            -f[1], -self._lengths[f[0]], f[0]))
+        return [(self._ids[n], score) for n, score in ranked]
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""This module contains the caches that keep data around between lookups."""
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def deep_sizeof(obj):
+    """Return an estimate of the memory used by an object, in bytes.
+
+    This follows dicts, lists and tuples, which is enough for parsed JSON.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k) + deep_sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_sizeof(item) for item in obj)
+    return size
+
+
+class LRUCache:
+    """A thread-safe cache that evicts the least recently used items.
+
+    Each item has a size, and the cache keeps the total under `max_bytes`.
+    The most recent item is always kept, even if it's bigger than the limit
+    by itself, so that it isn't reloaded on every lookup.
+    """
+
+    def __init__(self, max_bytes: int, sizeof=deep_sizeof):
+        """Create an empty cache.
+
+        `sizeof` is called to measure items that are added without a size.
+        """
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of items in the cache."""
+        return len(self._items)
+
+    def __contains__(self, key):
+        """Return True if the key is cached. This doesn't count as a use."""
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Return a cached item and mark it as recently used."""
+        with self._lock:
+            try:
+                value, _ = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size=None):
+        """Add an item, evicting old ones if the cache is over its budget."""
+        if size is None:
+            size = self.sizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, old_size) = self._items.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Remove an item and return it."""
+        with self._lock:
+            if key not in self._items:
+                return default
+            value, size = self._items.pop(key)
+            self.bytes -= size
+            return value
+
+    def clear(self):
+        """Remove every item. The counters are kept."""
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Return a dictionary of the cache's size and counters."""
+        return {'items': len(self._items),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+class DiskCache:
+    """A persistent cache of JSON data, stored in an SQLite file.
+
+    Items expire `ttl` seconds after they're stored, but expired items are
+    kept until they're evicted, so they can still be used when the network
+    is down. The least recently used items are evicted when the total size
+    of their JSON goes over `max_bytes`.
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        """Open the cache file, creating it if necessary."""
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS cache ('
+                             'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                             'size INTEGER NOT NULL, stored REAL NOT NULL, '
+                             'used REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS cache_used '
+                             'ON cache (used)')
+        self.bytes = self._db.execute(
+            'SELECT coalesce(sum(size), 0) FROM cache').fetchone()[0]
+
+    def __len__(self):
+        """Return the number of items in the cache, including expired ones."""
+        with self._lock:
+            row = self._db.execute('SELECT count(*) FROM cache').fetchone()
+        return row[0]
+
+    def get(self, key: str, default=None, stale=False):
+        """Return a cached item and mark it as recently used.
+
+        Expired items are only returned if `stale` is True.
+        """
+        with self._lock, self._db:
+            row = self._db.execute('SELECT value, stored FROM cache '
+                                   'WHERE key = ?', (key,)).fetchone()
+            now = time.time()
+            if row is None or (not stale and now - row[1] > self.ttl):
+                self.misses += 1
+                return default
+            self._db.execute('UPDATE cache SET used = ? WHERE key = ?',
+                             (now, key))
+            if now - row[1] > self.ttl:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value):
+        """Add an item, evicting old ones if the cache is over its budget."""
+        text = json.dumps(value, separators=(',', ':'))
+        size = len(text.encode('utf-8'))
+        now = time.time()
+        with self._lock, self._db:
+            old = self._db.execute('SELECT size FROM cache WHERE key = ?',
+                                   (key,)).fetchone()
+            if old is not None:
+                self.bytes -= old[0]
+            self._db.execute('INSERT OR REPLACE INTO cache '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             (key, text, size, now, now))
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = self._db.execute(
+                    'SELECT key, size FROM cache WHERE key != ? '
+                    'ORDER BY used LIMIT 1', (key,)).fetchone()
+                if oldest is None:
+                    break
+                self._db.execute('DELETE FROM cache WHERE key = ?',
+                                 (oldest[0],))
+                self.bytes -= oldest[1]
+                self.evictions += 1
+
+    def pop(self, key: str):
+        """Remove an item."""
+        with self._lock, self._db:
+            old = self._db.execute('SELECT size FROM cache WHERE key = ?',
+                                   (key,)).fetchone()
+            if old is not None:
+                self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+                self.bytes -= old[0]
+
+    def clear(self):
+        """Remove every item. The counters are kept."""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM cache')
+            self.bytes = 0
+
+    def stats(self):
+        """Return a dictionary of the cache's size and counters."""
+        return {'items': len(self),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
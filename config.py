@@ -4,3 +4,28 @@ UI_DIR = 'views'
 VOCABULARY_FILE = 'vocabulary.json'
 CONFIG_FILE = 'config.json'
 WORDNIK_API_URL = 'https://api.wordnik.com/v4'
+OPTED_DIR = 'opted'
+OPTED_BIN_FILE = 'opted.bin'
+OPTED_DB_FILE = 'opted.db'
+OPTED_ZIP_FILE = 'opted.zdb'
+OPTED_INDEX_DIR = 'opted-index'
+# The memory budget for parsed JSON shards, when opted.bin isn't built
+OPTED_CACHE_BYTES = 24 * 1024 * 1024
+WORDNIK_CACHE_FILE = 'wordnik-cache.db'
+# Wordnik responses are reused for this many seconds, or longer when offline
+WORDNIK_CACHE_TTL = 7 * 24 * 60 * 60
+WORDNIK_CACHE_BYTES = 8 * 1024 * 1024
+# How long to wait for all of a word's Wordnik requests, in seconds
+WORDNIK_TIMEOUT = 10
+# Seconds to wait for Wordnik to accept a connection, and for each read
+WORDNIK_CONNECT_TIMEOUT = 4
+WORDNIK_READ_TIMEOUT = 6
+# The key's quota, until the server reports it, and how many of those calls
+# are kept for interactive lookups when background work is running
+WORDNIK_CALLS_PER_HOUR = 100
+WORDNIK_QUOTA_RESERVE = 20
+# The memory budget for prefetched definitions, how many are fetched at once,
+# and how many words can wait in the queue
+PREFETCH_CACHE_BYTES = 2 * 1024 * 1024
+PREFETCH_WORKERS = 2
+PREFETCH_QUEUE = 30
@@ -5,11 +5,40 @@ Outside of this module, you'll usually just call the define() function.
 """
 import console
 import json
-import re
-from urllib.error import URLError
-from config import CONFIG_FILE
+import os
+import sqlite3
+import string
+import threading
+import unicodedata
+from concurrent import futures
+from urllib.error import HTTPError, URLError
+import cache
+import lexicon
+import optedbin
+import optedsql
+import optedzip
+import prefetch
+import prewarm
+from config import (CONFIG_FILE, OPTED_DIR, OPTED_BIN_FILE, OPTED_DB_FILE,
+                    OPTED_ZIP_FILE, OPTED_CACHE_BYTES, WORDNIK_CACHE_FILE,
+                    WORDNIK_CACHE_TTL, WORDNIK_CACHE_BYTES, WORDNIK_TIMEOUT,
+                    WORDNIK_CONNECT_TIMEOUT, WORDNIK_READ_TIMEOUT,
+                    WORDNIK_CALLS_PER_HOUR, WORDNIK_QUOTA_RESERVE,
+                    PREFETCH_CACHE_BYTES, PREFETCH_WORKERS, PREFETCH_QUEUE)
 
 WORDNIK_IS_LOADED = False
+OFFLINE_MESSAGES = [
+    'WordRoom is using a limited offline dictionary.',
+    '''This app is a free personal project, so I don't share my online
+    API access. <a href="https://developer.wordnik.com/">You can get
+    your own from developer.wordnik.com</a>''',
+    '''<a href="wordroom://-change_key">Add an API key to WordRoom
+    here.</a>''']
+# Raw Wordnik responses, so words from history open instantly and offline.
+# It's opened once there's an API key.
+wordnik_cache = None
+# Runs the requests for one lookup at the same time
+wordnik_pool = futures.ThreadPoolExecutor(max_workers=4)
 
 
 def check_wordnik_key():
@@ -17,6 +46,7 @@ def check_wordnik_key():
     global WORDNIK_API_KEY
     global WORDNIK_IS_LOADED
     global wn_api
+    global wordnik_cache
     try:
         with open(CONFIG_FILE, 'r') as file:
             WORDNIK_API_KEY = json.load(file).get('wordnik_api_key')
@@ -25,12 +55,35 @@ def check_wordnik_key():
         WORDNIK_API_KEY = None
     if WORDNIK_API_KEY:
         try:
-            wn_api = WordApi(swagger.ApiClient(WORDNIK_API_KEY,
-                                               WORDNIK_API_URL))
+            pool = swagger.ConnectionPool(
+                connectTimeout=WORDNIK_CONNECT_TIMEOUT,
+                readTimeout=WORDNIK_READ_TIMEOUT)
+            client = swagger.ApiClient(WORDNIK_API_KEY, WORDNIK_API_URL, pool)
+            if wordnik_cache is None:
+                wordnik_cache = cache.DiskCache(
+                    WORDNIK_CACHE_FILE, WORDNIK_CACHE_TTL, WORDNIK_CACHE_BYTES)
+            client.cache = wordnik_cache
+            # Only the endpoints that wordnik() uses. They don't change
+            # between requests, unlike random words.
+            client.cacheEndpoint('/word.json/{word}/definitions')
+            client.cacheEndpoint('/word.json/{word}')
+            client.limiter = swagger.RateLimiter(
+                WORDNIK_CALLS_PER_HOUR, quotaReserve=WORDNIK_QUOTA_RESERVE)
+            client.breaker.addListener(wordnik_health_changed)
+            wn_api = WordApi(client)
         except NameError:
             WORDNIK_IS_LOADED = False
 
 
+def wordnik_health_changed(old_state: str, new_state: str):
+    """Log when the Wordnik circuit breaker opens or closes.
+
+    While it's open, wordnik() falls back to opted() without waiting on the
+    network.
+    """
+    print('Wordnik connection went from %s to %s.' % (old_state, new_state))
+
+
 try:
     from wordnik import swagger
     from wordnik.WordApi import WordApi
@@ -56,73 +109,397 @@ def define(word: str):
     }
     """
     if WORDNIK_IS_LOADED:
-        data = wordnik(word)
+        data = prefetcher.get(normalize(word))
+        if data is None:
+            with prefetcher.foreground():
+                data = wordnik(word)
+        else:
+            data = dict(data, messages=list(data['messages']))
     else:
         data = opted(word)
-        m = ['WordRoom is using a limited offline dictionary.',
-             '''This app is a free personal project, so I don't share my online
-             API access. <a href="https://developer.wordnik.com/">You can get
-             your own from developer.wordnik.com</a>''',
-             '''<a href="wordroom://-change_key">Add an API key to WordRoom
-             here.</a>''']
-        if not data['definitions']:
-            data['messages'] += m
+        add_offline_messages(data)
     data['word'] = word
     return data
 
 
+def add_offline_messages(data: dict):
+    """Explain how to get online definitions when a word wasn't found."""
+    if not data['definitions']:
+        data['messages'] += OFFLINE_MESSAGES
+
+
+def define_many(words):
+    """Yield the define() result of each word in a list, in the same order.
+
+    Offline, the words are grouped by the shard or block that holds them, so
+    each group is resolved in one pass while its data is loaded. Results are
+    yielded as soon as every word before them is done. Repeated words are
+    only looked up once. Online, this is the same as calling define() for
+    each word.
+    """
+    words = list(words)
+    if WORDNIK_IS_LOADED:
+        for word in words:
+            yield define(word)
+        return
+    groups = {}
+    for n, word in enumerate(words):
+        groups.setdefault(opted_group(word), []).append(n)
+    found = {}
+    results = {}
+    position = 0
+    for group in groups.values():
+        with prewarmer.foreground():
+            for n in group:
+                word = words[n]
+                if word not in found:
+                    found[word] = opted_definitions(word)
+                results[n] = found[word]
+        while position in results:
+            definitions, suggestions, messages = results.pop(position)
+            data = opted_data(list(definitions), list(suggestions),
+                              list(messages))
+            add_offline_messages(data)
+            data['word'] = words[position]
+            yield data
+            position += 1
+
+
+def normalize(word: str):
+    """Return the form of a word that's sent to Wordnik.
+
+    Responses are cached by the API client, so this makes the same word
+    always use the same cache entry.
+    """
+    return unicodedata.normalize('NFC', word.strip())
+
+
 def wordnik(word: str):
     """Return the WordNik definition of a word.
 
     If can't connect to WordNik API, then return opted() instead.
     """
+    word = normalize(word)
+    console.show_activity()
     try:
-        console.show_activity()
-        defs = wn_api.getDefinitions(word, limit=5) or []
-        suggs = wn_api.getWord(word, includeSuggestions=True)
-        console.hide_activity()
-        suggestions = suggs.suggestions or []
-        definitions = [{'text': d.text,
-                        'partOfSpeech': d.partOfSpeech} for d in defs]
-        if defs:
-            attribution = defs[0].attributionText
-            attribution_url = defs[0].attributionUrl
-        else:
-            attribution = ''
-            attribution_url = ''
-        data = {'definitions': definitions,
-                'attribution': attribution,
-                'attributionUrl': attribution_url,
-                'suggestions': suggestions,
-                'messages': []}
+        data = wordnik_data(word)
     except URLError as e:
         print(e)
         data = opted(word)
         data['messages'].append('''WordRoom couldn't connect to WordNik.com to
                                 retrieve online definitions.''')
+    finally:
+        console.hide_activity()
     return data
 
 
-opted_cache = {}
+def wordnik_data(word: str):
+    """Return the WordNik definition of a normalized word.
 
+    Raises URLError if it can't be retrieved.
+    """
+    jobs = [wordnik_pool.submit(wn_api.getDefinitions, word, limit=5),
+            wordnik_pool.submit(wn_api.getWord, word, includeSuggestions=True)]
+    # Both requests share one timeout, and if either fails, the other one's
+    # result isn't needed.
+    done, pending = futures.wait(jobs, WORDNIK_TIMEOUT,
+                                 futures.FIRST_EXCEPTION)
+    for job in pending:
+        job.cancel()
+    for job in done:
+        if job.exception() is not None:
+            raise job.exception()
+    if pending:
+        raise URLError('timed out after %g seconds' % WORDNIK_TIMEOUT)
+    return wordnik_format(jobs[0].result(), jobs[1].result())
 
-def opted(word: str):
-    """Return the OPTED definition of a word."""
-    messages = []
-    alpha = re.sub('[^a-zA-Z]', '', word)[:1].lower()
-    if not opted_cache.get(alpha) and alpha:
+
+def wordnik_format(defs, suggs):
+    """Return the define() data for WordNik's definitions and word info."""
+    defs = defs or []
+    suggestions = (suggs and suggs.suggestions) or []
+    definitions = [{'text': d.text,
+                    'partOfSpeech': d.partOfSpeech} for d in defs]
+    if defs:
+        attribution = defs[0].attributionText
+        attribution_url = defs[0].attributionUrl
+    else:
+        attribution = ''
+        attribution_url = ''
+    return {'definitions': definitions,
+            'attribution': attribution,
+            'attributionUrl': attribution_url,
+            'suggestions': suggestions,
+            'messages': []}
+
+
+def prefetch_definition(word: str):
+    """Return the WordNik definition of a word for the prefetcher.
+
+    The requests are sent one at a time from the prefetcher's own thread,
+    at background priority, so they never hold up wordnik_pool or use the
+    calls that are kept for lookups. Errors from the server or the rate
+    limiter are raised, so the prefetcher backs off, but a word that
+    Wordnik rejects is just skipped.
+    """
+    try:
+        with swagger.background():
+            return wordnik_format(
+                wn_api.getDefinitions(word, limit=5),
+                wn_api.getWord(word, includeSuggestions=True))
+    except HTTPError as e:
+        if e.code >= 500 or e.code == 429:
+            raise
+        return None
+
+
+# Definitions of the words the user is likely to open next
+prefetcher = prefetch.Prefetcher(prefetch_definition,
+                                 cache.LRUCache(PREFETCH_CACHE_BYTES),
+                                 PREFETCH_WORKERS, PREFETCH_QUEUE)
+
+
+def start_prefetching(words, priority=prefetch.VISIBLE):
+    """Queue words to be looked up in the background.
+
+    This does nothing offline, since the offline dictionary is prewarmed
+    instead.
+    """
+    if WORDNIK_IS_LOADED:
+        prefetcher.schedule([normalize(word) for word in words], priority)
+        prefetcher.start()
+
+
+def prefetch_links(data: dict):
+    """Queue the suggestions and links in a define() result."""
+    words = list(data['suggestions'])
+    for definition in data['definitions']:
+        words += [link for _, link in definition.get('parts', ()) if link]
+    # Reversed, so the first link goes first.
+    start_prefetching(reversed(words), prefetch.LINK)
+
+
+# Parsed shards take about 5 times as much memory as their JSON files.
+SHARD_MEMORY_RATIO = 5
+opted_cache = cache.LRUCache(OPTED_CACHE_BYTES)
+# One for each letter, held while its shard is parsed, so a shard isn't
+# parsed twice at once but different shards can be
+_shard_locks = {alpha: threading.Lock() for alpha in string.ascii_lowercase}
+opted_binary = None
+opted_lexicon = None
+opted_zip = None
+opted_sql = None
+
+
+def load_opted_binary():
+    """Open the compiled offline dictionary, if it has been built.
+
+    Until it's built, opted() falls back to parsing the JSON shards.
+    """
+    global opted_binary
+    global opted_lexicon
+    try:
+        opted_binary = optedbin.OptedBinary(OPTED_BIN_FILE)
+        opted_lexicon = lexicon.Lexicon(opted_binary)
+    except (FileNotFoundError, ValueError):
+        opted_binary = None
+        opted_lexicon = None
+    return opted_binary
+
+
+def build_opted_binary():
+    """Compile the offline dictionary and its indexes if they are stale."""
+    if optedbin.is_stale():
+        optedbin.compile_opted()
+    if load_opted_binary() is not None:
+        opted_lexicon.build()
+    return opted_binary
+
+
+def load_opted_sql():
+    """Open the optional SQLite dictionary, if it has been built.
+
+    It's only used for lookups when the compiled binary isn't available, but
+    it also answers queries by part of speech, prefix and definition text.
+    """
+    global opted_sql
+    try:
+        opted_sql = optedsql.OptedSQL(OPTED_DB_FILE)
+    except (FileNotFoundError, sqlite3.Error):
+        opted_sql = None
+    return opted_sql
+
+
+def load_opted_zip():
+    """Open the compressed offline dictionary, if there is one.
+
+    The container is much smaller than the JSON shards, so it can be shipped
+    in their place. It's used when the compiled binary isn't available.
+    """
+    global opted_zip
+    try:
+        opted_zip = optedzip.OptedZip(OPTED_ZIP_FILE)
+    except (FileNotFoundError, ValueError):
+        opted_zip = None
+    return opted_zip
+
+
+load_opted_binary()
+load_opted_zip()
+load_opted_sql()
+
+
+def complete(prefix: str, limit=5):
+    """Return a list of dictionary words that begin with a prefix.
+
+    This is used for search suggestions, so it only uses the offline
+    dictionary and never waits on the network.
+    """
+    if opted_lexicon is not None:
+        return opted_lexicon.complete(prefix, limit)
+    elif opted_sql is not None and prefix.strip():
+        return opted_sql.by_prefix(prefix.casefold().lstrip(), limit)
+    return []
+
+
+def random_word(**filters):
+    """Return a random word from the offline dictionary, or None.
+
+    This takes the same filters as `lexicon.Lexicon.random_words`. It's None
+    until the random word index has been built in the background.
+    """
+    if opted_lexicon is None:
+        return None
+    return opted_lexicon.random_word(**filters)
+
+
+def opted_shard(word: str, messages: list):
+    """Return a word's definitions from its JSON shard.
+
+    This is the fallback for when no compiled dictionary is available.
+    """
+    alpha = optedbin.shard_letter(word)
+    if not alpha:  # if the input had no ascii letters
+        return []
+    shard = load_shard(alpha)
+    if shard is None:
+        messages.append('''WordRoom couldn't load the offline dictionary.
+                        If you're storing WordRoom in iCloud, check that
+                        iOS downloaded all of its files.''')
+        return []
+    return shard.get(word) or []
+
+
+def load_shard(alpha: str):
+    """Return a parsed shard from the cache, loading it if necessary.
+
+    Return None if the shard's file is missing. Missing shards aren't cached,
+    since iCloud may download them later.
+    """
+    shard = opted_cache.get(alpha)
+    if shard is not None:
+        return shard
+    with _shard_locks[alpha]:
+        if alpha in opted_cache:  # another thread just loaded it
+            return opted_cache.get(alpha)
+        path = os.path.join(OPTED_DIR, alpha + '.json')
         try:
-            with open('opted/' + alpha + '.json', 'r') as f:
-                opted_cache[alpha] = json.load(f)
+            with open(path, 'r') as f:
+                shard = json.load(f)
         except FileNotFoundError:
-            opted_cache[alpha] = {}
-            messages.append('''WordRoom couldn't load the offline dictionary.
-                            If you're storing WordRoom in iCloud, check that
-                            iOS downloaded all of its files.''')
+            return None
+        size = os.path.getsize(path) * SHARD_MEMORY_RATIO
+        opted_cache.put(alpha, shard, size)
+    return shard
+
+
+def prewarm_shard(alpha: str):
+    """Load a shard in the background, if it would be useful.
+
+    Nothing is loaded once the compiled dictionary is available, or if the
+    shard would push other shards out of the cache.
+    """
+    if (opted_binary is not None or opted_zip is not None
+            or opted_sql is not None):
+        return False
+    if alpha in opted_cache:
+        return False
+    try:
+        size = os.path.getsize(os.path.join(OPTED_DIR, alpha + '.json'))
+    except FileNotFoundError:
+        return False
+    if opted_cache.bytes + size * SHARD_MEMORY_RATIO > opted_cache.max_bytes:
+        return False
+    return load_shard(alpha) is not None
+
+
+prewarmer = prewarm.Prewarmer(prewarm_shard)
+
+
+def start_prewarming(words):
+    """Start loading the shards that a list of words is most likely to need.
+
+    Shards are ordered by how many of the words start with their letter.
+    """
+    counts = {}
+    for word in words:
+        alpha = optedbin.shard_letter(word)
+        if alpha:
+            counts[alpha] = counts.get(alpha, 0) + 1
+    prewarmer.schedule(counts)
+    prewarmer.start()
+
+
+def prewarm_for(query: str):
+    """Move the shard for a partly typed word to the front of the queue."""
+    alpha = optedbin.shard_letter(query)
     if alpha:
-        definitions = opted_cache[alpha].get(word) or []
-    else:  # if the input had no ascii letters
-        definitions = []
+        prewarmer.prioritize(alpha)
+
+
+def opted_group(word: str):
+    """Return which part of the offline dictionary a word is stored in.
+
+    Words in the same group are read from the same shard or block.
+    """
+    if opted_lexicon is not None:
+        return None  # one file, which is always mapped
+    elif opted_zip is not None:
+        return opted_zip.block_of(word)
+    elif opted_sql is not None:
+        return None
+    return optedbin.shard_letter(word)
+
+
+def opted_definitions(word: str):
+    """Return a word's OPTED definitions, suggestions and error messages.
+
+    This uses the best offline dictionary that's available.
+    """
+    messages = []
+    suggestions = []
+    key = lexicon.normalize_key(word)
+    if opted_lexicon is not None:
+        definitions = opted_lexicon.lookup(word)
+        if not definitions and key:
+            suggestions = opted_lexicon.suggest(word)
+    elif opted_zip is not None:
+        definitions = opted_zip.lookup(word)
+        if not definitions and key != word:
+            definitions = opted_zip.lookup(key)
+    elif opted_sql is not None:
+        definitions = opted_sql.lookup(word)
+        if not definitions and key != word:
+            definitions = opted_sql.lookup(key)
+    else:
+        definitions = opted_shard(word, messages)
+        if not definitions and key != word:
+            definitions = opted_shard(key, messages)
+    return definitions, suggestions, messages
+
+
+def opted_data(definitions: list, suggestions: list, messages: list):
+    """Return the define() dictionary for a set of OPTED definitions."""
     if len(definitions) > 0:
         attr = 'from The Online Plain Text English Dictionary, Public Domain.'
         attribution_url = 'http://www.mso.anu.edu.au/%7Eralph/OPTED/index.html'
@@ -132,5 +509,12 @@ def opted(word: str):
     return {'definitions': definitions,
             'attribution': attr,
             'attributionUrl': attribution_url,
-            'suggestions': [],
+            'suggestions': suggestions,
             'messages': messages}
+
+
+def opted(word: str):
+    """Return the OPTED definition of a word."""
+    with prewarmer.foreground():
+        definitions, suggestions, messages = opted_definitions(word)
+    return opted_data(definitions, suggestions, messages)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""This module indexes the offline dictionary by part of speech.
+
+For each part of speech name (see `partofspeech`), the index stores the
+sorted ids of every headword with a definition of that kind. Filtering and
+paging by part of speech is then a slice of an array, and facet counts are
+the lengths of the arrays, without reading any definitions. It also keeps
+the number of definitions of each headword, so `randomwords` can be built
+from it without a second pass over the dictionary.
+"""
+import bisect
+import heapq
+import json
+import struct
+from array import array
+from partofspeech import classify
+
+MAGIC = b'WRFACET2'
+HEADER = struct.Struct('<8sII')  # magic, number of headwords, directory size
+FACET_NAME = 'partOfSpeech'
+
+
+def compile_facets(binary, dest: str):
+    """Build the facet index for an `optedbin.OptedBinary` and save it.
+
+    The file holds a JSON directory of `name: [offset, count]`, the number
+    of definitions of each headword (up to 255), and then one array of
+    unsigned ints with every id list.
+    """
+    lists = {}
+    counts = array('B')
+    for i in range(len(binary)):
+        definitions = binary.definitions(i)
+        counts.append(min(len(definitions), 255))
+        names = set()
+        for d in definitions:
+            names |= classify(d['partOfSpeech'])
+        for name in names:
+            lists.setdefault(name, []).append(i)
+    data = array('I')
+    directory = {}
+    for name in sorted(lists):
+        directory[name] = [len(data), len(lists[name])]
+        data.extend(lists[name])
+    blob = json.dumps(directory, separators=(',', ':')).encode('utf-8')
+    with open(dest, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(binary), len(blob)))
+        f.write(blob)
+        counts.tofile(f)
+        data.tofile(f)
+
+
+class FacetIndex:
+    """Filter, page and count headwords by part of speech."""
+
+    FILE = 'facets.bin'
+
+    def __init__(self, path: str):
+        """Load the index from a file."""
+        with open(path, 'rb') as f:
+            magic, count, size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('%s is not a facet index.' % path)
+            self.directory = json.loads(f.read(size).decode('utf-8'))
+            self.definition_counts = array('B')
+            self.definition_counts.fromfile(f, count)
+            self.data = array('I')
+            self.data.frombytes(f.read())
+        self._view = memoryview(self.data)
+
+    def __contains__(self, name: str):
+        """Return True if the name is an indexed part of speech."""
+        return name in self.directory
+
+    def ids(self, name: str):
+        """Return the sorted headword ids for a part of speech."""
+        offset, count = self.directory.get(name, (0, 0))
+        return self._view[offset:offset + count]
+
+    def has(self, i: int, name: str):
+        """Return True if a headword has a part of speech."""
+        ids = self.ids(name)
+        n = bisect.bisect_left(ids, i)
+        return n < len(ids) and ids[n] == i
+
+    def counts(self):
+        """Return the facet counts, shaped like Wordnik's `Facet` model."""
+        values = [{'value': name, 'count': count}
+                  for name, (_, count) in self.directory.items()]
+        values.sort(key=lambda v: -v['count'])
+        return {'name': FACET_NAME, 'facetValues': values}
+
+    def query(self, include=(), exclude=()):
+        """Return an iterator of headword ids, in sorted order.
+
+        Headwords must have at least one of the `include` parts of speech,
+        and none of the `exclude` ones. This works like the
+        includePartOfSpeech and excludePartOfSpeech parameters in Wordnik.
+        """
+        if len(include) == 1:
+            ids = iter(self.ids(include[0]))
+        else:
+            ids = _unique(heapq.merge(*(self.ids(name) for name in include)))
+        for i in ids:
+            if not any(self.has(i, name) for name in exclude):
+                yield i
+
+
+def _unique(ids):
+    previous = None
+    for i in ids:
+        if i != previous:
+            yield i
+        previous = i
@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""This module contains the offline indexes built over the OPTED headwords.
+
+The indexes are built from the compiled dictionary (see `optedbin`) and saved
+in the index directory, so they're only rebuilt when the dictionary changes.
+The Lexicon class loads each index the first time it's needed.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+import anagrams
+import facets
+import links
+import patterns
+import randomwords
+import reverse
+import spelling
+from itertools import islice
+from config import OPTED_INDEX_DIR
+
+_VOWELS = 'aeiou'
+_VOWEL_GROUPS = re.compile('[aeiouy]+')
+_SIMPLE_WORD = re.compile('[a-z]+$')
+# Runs of whitespace or hyphens between two words, like "aard - vark"
+_SEPARATORS = re.compile(r'(?<=\S)[\s\-\u2010-\u2015]+(?=\S)')
+
+
+def normalize_key(word: str):
+    """Return a word folded into the form used for index keys.
+
+    This casefolds the word, strips accents (so "Café" becomes "cafe"), and
+    replaces any whitespace or hyphens between words with a single space.
+    Leading and trailing hyphens are kept, since OPTED uses them to mark
+    prefixes and suffixes like "-able".
+    """
+    word = unicodedata.normalize('NFKD', word.casefold().strip())
+    word = ''.join(c for c in word if not unicodedata.combining(c))
+    return _SEPARATORS.sub(' ', word)
+
+
+def index_path(name: str):
+    """Return the path of an index file."""
+    return os.path.join(OPTED_INDEX_DIR, name)
+
+
+def is_fresh(path: str, binary, magic=None):
+    """Return True if an index file is newer than the compiled dictionary.
+
+    If the index has a `magic` number, the file also has to start with it,
+    so one saved by an older version in another format is out of date.
+    """
+    try:
+        if os.path.getmtime(path) < os.path.getmtime(binary.path):
+            return False
+        if magic is None:
+            return True
+        with open(path, 'rb') as f:
+            return f.read(len(magic)) == magic
+    except FileNotFoundError:
+        return False
+
+
+def save_json(path: str, data):
+    """Write an index to a JSON file."""
+    with open(path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+def load_json(path: str):
+    """Read an index from a JSON file."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class KeyIndex:
+    """Map normalized keys to their canonical headwords.
+
+    Most headwords are already their own key, so only the ones that aren't
+    are stored. When two headwords share a key, the one that is spelled
+    exactly like the key wins.
+    """
+
+    FILE = 'keys.json'
+
+    def __init__(self, keys: dict):
+        """Create the index from a dictionary of keys and headwords."""
+        self.keys = keys
+
+    @classmethod
+    def build(cls, headwords):
+        """Build the index from an iterable of headwords."""
+        headwords = list(headwords)
+        own = set(headwords)
+        keys = {}
+        for word in headwords:
+            key = normalize_key(word)
+            if key != word and key not in own:
+                keys.setdefault(key, word)
+        return cls(keys)
+
+    def canonical(self, word: str):
+        """Return the headword that a word normalizes to.
+
+        If no headword has the same key, the normalized word is returned, so
+        the caller can always look it up directly.
+        """
+        key = normalize_key(word)
+        return self.keys.get(key, key)
+
+
+def _is_short_cvc(word: str):
+    """Return True if a word's final consonant doubles, like "stop"."""
+    return (len(word) >= 3 and len(_VOWEL_GROUPS.findall(word)) == 1
+            and word[-1] not in _VOWELS + 'wxy'
+            and word[-2] in _VOWELS and word[-3] not in _VOWELS)
+
+
+def _plurals(word: str):
+    if word.endswith(('s', 'x', 'z', 'ch', 'sh')):
+        yield word + 'es'
+    elif word.endswith('y') and word[-2:-1] not in _VOWELS:
+        yield word[:-1] + 'ies'
+    else:
+        yield word + 's'
+    if word.endswith('fe'):
+        yield word[:-2] + 'ves'
+    elif word.endswith('f'):
+        yield word[:-1] + 'ves'
+
+
+def _verb_forms(word: str):
+    yield from _plurals(word)
+    if word.endswith('ie'):
+        yield word[:-2] + 'ying'
+    elif word.endswith('e') and not word.endswith(('ee', 'ye', 'oe')):
+        yield word[:-1] + 'ing'
+    else:
+        yield word + 'ing'
+    if word.endswith('e'):
+        yield word + 'd'
+    elif word.endswith('y') and word[-2:-1] not in _VOWELS:
+        yield word[:-1] + 'ied'
+    else:
+        yield word + 'ed'
+    if _is_short_cvc(word):
+        yield word + word[-1] + 'ed'
+        yield word + word[-1] + 'ing'
+
+
+def _adjective_forms(word: str):
+    # Only short adjectives take -er and -est. Longer ones use "more".
+    if len(_VOWEL_GROUPS.findall(word)) > 2 or len(word) > 7:
+        return
+    if word.endswith('e'):
+        yield word + 'r'
+        yield word + 'st'
+    elif word.endswith('y') and word[-2:-1] not in _VOWELS:
+        yield word[:-1] + 'ier'
+        yield word[:-1] + 'iest'
+    elif _is_short_cvc(word):
+        yield word + word[-1] + 'er'
+        yield word + word[-1] + 'est'
+    else:
+        yield word + 'er'
+        yield word + 'est'
+
+
+def inflections(word: str, parts_of_speech):
+    """Return an iterator of the regular inflections of a word.
+
+    `parts_of_speech` is a collection of OPTED part of speech labels, like
+    "n." or "v. t.", which decide which suffix rules apply.
+    """
+    kinds = {p.strip()[:1] for p in parts_of_speech}
+    if 'n' in kinds:
+        yield from _plurals(word)
+    if 'v' in kinds:
+        yield from _verb_forms(word)
+    # OPTED labels many comparable adjectives as "superl."
+    if any(p.strip().rstrip('.') in ('a', 'superl') for p in parts_of_speech):
+        yield from _adjective_forms(word)
+
+
+class LemmaIndex:
+    """Map regular inflections, like "cats" or "running", to their lemmas.
+
+    The table is generated ahead of time by applying suffix rules to every
+    headword, and keeping the forms that aren't headwords themselves. That
+    way, finding a lemma is one dictionary probe instead of a series of
+    guesses at which suffix to strip.
+    """
+
+    FILE = 'lemmas.json'
+
+    def __init__(self, lemmas: dict):
+        """Create the index from a dictionary of forms and headword ids."""
+        self.lemmas = lemmas
+
+    @classmethod
+    def build(cls, binary):
+        """Build the index from an `optedbin.OptedBinary`."""
+        lemmas = {}
+        for i in range(len(binary)):
+            word = binary.headword(i)
+            if not _SIMPLE_WORD.match(word):
+                continue
+            parts = {d['partOfSpeech'] for d in binary.definitions(i)}
+            for form in inflections(word, parts):
+                if form not in lemmas and binary.find(form) == -1:
+                    lemmas[form] = i
+        return cls(lemmas)
+
+    def get(self, word: str):
+        """Return the headword id of a word's lemma, or -1."""
+        return self.lemmas.get(word, -1)
+
+
+def _index_property(name: str, doc: str):
+    """Return a property that loads an index, building it if necessary."""
+    return property(lambda self: self.index(name), doc=doc)
+
+
+class Lexicon:
+    """Load and build the offline indexes for a compiled dictionary.
+
+    Building an index takes seconds, so the lookup functions never do it.
+    They get None from `index(name, build=False)` and do without the index
+    until `build()` has finished in the background.
+    """
+
+    # name: (file, magic, compile(binary, dest), load(path))
+    INDEXES = {
+        'keys': (KeyIndex.FILE, None,
+                 lambda binary, dest: save_json(
+                     dest, KeyIndex.build(binary.headwords()).keys),
+                 lambda path: KeyIndex(load_json(path))),
+        'lemmas': (LemmaIndex.FILE, None,
+                   lambda binary, dest: save_json(
+                       dest, LemmaIndex.build(binary).lemmas),
+                   lambda path: LemmaIndex(load_json(path))),
+        'spelling': (spelling.SpellIndex.FILE, spelling.MAGIC,
+                     lambda binary, dest: spelling.compile_spelling(
+                         list(binary.headwords()), dest),
+                     spelling.SpellIndex),
+        'reverse': (reverse.ReverseIndex.FILE, reverse.MAGIC,
+                    reverse.compile_reverse, reverse.ReverseIndex),
+        'patterns': (patterns.PatternIndex.FILE, patterns.MAGIC,
+                     lambda binary, dest: patterns.compile_patterns(
+                         binary.headwords(), dest),
+                     patterns.PatternIndex),
+        'facets': (facets.FacetIndex.FILE, facets.MAGIC,
+                   facets.compile_facets, facets.FacetIndex),
+        # This is built from the facet index, which comes first in build()
+        'random': (randomwords.RandomIndex.FILE, randomwords.MAGIC,
+                   lambda binary, dest: randomwords.compile_random(
+                       binary, Lexicon(binary).facets, dest),
+                   randomwords.RandomIndex),
+        'anagram_index': (anagrams.AnagramIndex.FILE, anagrams.MAGIC,
+                          lambda binary, dest: anagrams.compile_anagrams(
+                              list(binary.headwords()), dest),
+                          anagrams.AnagramIndex),
+        'links': (links.LinkIndex.FILE, links.MAGIC, links.compile_links,
+                  links.LinkIndex),
+    }
+
+    # Every lexicon saves its indexes in the same directory, so they share
+    # these, in case define reopens the dictionary while one is building.
+    _locks = {name: threading.Lock() for name in INDEXES}
+
+    def __init__(self, binary):
+        """Create the lexicon for an `optedbin.OptedBinary`."""
+        self.binary = binary
+        self._indexes = {}
+
+    def index(self, name: str, build=True):
+        """Return an index, loading it the first time.
+
+        If the saved index is out of date or in an old format, it's built
+        and saved first, or if `build` is False, None is returned instead.
+        Only one thread builds an index at a time, and the others wait for
+        it, unless they passed `build=False`.
+        """
+        index = self._indexes.get(name)
+        if index is not None:
+            return index
+        filename, magic, compile_index, load = self.INDEXES[name]
+        path = index_path(filename)
+        if not build and not is_fresh(path, self.binary, magic):
+            return None
+        lock = self._locks[name]
+        if not lock.acquire(build):
+            return None  # another thread is building it
+        try:
+            index = self._indexes.get(name)
+            if index is None:
+                if not is_fresh(path, self.binary, magic):
+                    if not build:
+                        return None
+                    self._compile(compile_index, path)
+                index = load(path)
+                self._indexes[name] = index
+            return index
+        finally:
+            lock.release()
+
+    def compile(self, name: str):
+        """Build and save an index if it's out of date, without loading it."""
+        filename, magic, compile_index, _ = self.INDEXES[name]
+        path = index_path(filename)
+        with self._locks[name]:
+            if not is_fresh(path, self.binary, magic):
+                self._compile(compile_index, path)
+
+    def _compile(self, compile_index, path: str):
+        # Each build writes its own temporary file, so the index can't be
+        # replaced by a half-written one.
+        os.makedirs(OPTED_INDEX_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=OPTED_INDEX_DIR)
+        os.close(fd)
+        try:
+            compile_index(self.binary, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    keys = _index_property('keys', 'The KeyIndex of normalized headwords.')
+    lemmas = _index_property('lemmas',
+                             'The LemmaIndex of regular inflections.')
+    spelling = _index_property('spelling',
+                               'The `spelling.SpellIndex` for suggestions.')
+    reverse = _index_property('reverse',
+                              'The `reverse.ReverseIndex` of definitions.')
+    patterns = _index_property(
+        'patterns', 'The `patterns.PatternIndex` for wildcard searches.')
+    random = _index_property(
+        'random', 'The `randomwords.RandomIndex` for random words.')
+    facets = _index_property('facets',
+                             'The `facets.FacetIndex` of parts of speech.')
+    anagram_index = _index_property(
+        'anagram_index', 'The `anagrams.AnagramIndex` for anagrams.')
+    links = _index_property(
+        'links', 'The `links.LinkIndex` of references between entries.')
+
+    def build(self):
+        """Build and save every index that's out of date.
+
+        This is slow the first time, so call it from a background thread.
+        Nothing is loaded here; each index is loaded the first time it's
+        used.
+        """
+        for name in self.INDEXES:
+            self.compile(name)
+
+    def find(self, word: str):
+        """Return the id of the headword that best matches a word, or -1.
+
+        The exact spelling is tried first, since a few headwords only differ
+        by punctuation. Then it's one probe of the key index, ignoring case
+        and accents, and one probe of the lemma index for inflected forms.
+        Until those indexes are built, only the exact spelling and its
+        normalized key are tried.
+        """
+        i = self.binary.find(word)
+        if i == -1:
+            keys = self.index('keys', build=False)
+            if keys is not None:
+                canonical = keys.canonical(word)
+            else:
+                canonical = normalize_key(word)
+            if canonical != word:
+                i = self.binary.find(canonical)
+            lemmas = self.index('lemmas', build=False)
+            if i == -1 and lemmas is not None:
+                i = lemmas.get(canonical)
+        return i
+
+    def lookup(self, word: str):
+        """Return the definitions for a word, or an empty list."""
+        i = self.find(word)
+        if i == -1:
+            return []
+        return self.definitions(i)
+
+    def definitions(self, i: int):
+        """Return the definitions of a headword, with their links.
+
+        Each definition gets a `parts` list of `[text, headword]` pieces,
+        where the headword is None for plain text. The links were found
+        when the index was built, so this only slices the text. Until then,
+        the definitions don't have `parts`.
+        """
+        definitions = self.binary.definitions(i)
+        link_index = self.index('links', build=False)
+        if link_index is None:
+            return definitions
+        spans = [[] for _ in definitions]
+        for n, start, end, target in link_index.links(i):
+            spans[n].append((start, end, self.binary[target]))
+        for d, found in zip(definitions, spans):
+            d['parts'] = links.segments(d['text'], found)
+        return definitions
+
+    def suggest(self, word: str, limit=5):
+        """Return a list of headwords that are spelled like a word.
+
+        This returns nothing until `build()` has saved the spelling index.
+        """
+        index = self.index('spelling', build=False)
+        if index is None:
+            return []
+        ids = index.suggest(normalize_key(word), self.binary, limit)
+        return [self.binary[i] for i in ids]
+
+    def reverse_lookup(self, query: str, limit=10):
+        """Return a list of headwords whose definitions match a query."""
+        return [self.binary[i] for i, _ in self.reverse.search(query, limit)]
+
+    def complete(self, prefix: str, limit=5):
+        """Return up to `limit` headwords that begin with a prefix.
+
+        The headwords are already sorted in the compiled dictionary, so the
+        ones with the prefix are found with two binary searches. They're
+        ranked by the size of their entries, like spelling suggestions, and
+        OPTED's slashed variants like "ca/oncito" are skipped.
+        """
+        key = prefix.casefold().lstrip().encode('utf-8')
+        if not key:
+            return []
+        start = self.binary.bisect(key)
+        # UTF-8 never has a 0xff byte, so every word with the prefix is less
+        end = self.binary.bisect(key + b'\xff')
+        sizes = self.binary.entry_sizes(start, end)
+        ranked = sorted(range(end - start), key=lambda n: -sizes[n])
+        words = (self.binary[start + n] for n in ranked)
+        return list(islice((w for w in words if '/' not in w), limit))
+
+    def has_part_of_speech(self, i: int, part_of_speech: str):
+        """Return True if a headword has a definition for a part of speech.
+
+        Names like "noun" are checked in the facet index, without reading
+        the definitions. Anything else is compared to the OPTED labels.
+        """
+        if part_of_speech in self.facets:
+            return self.facets.has(i, part_of_speech)
+        return any(d['partOfSpeech'].strip() == part_of_speech
+                   for d in self.binary.definitions(i))
+
+    def facet_counts(self):
+        """Return the number of headwords for each part of speech.
+
+        The result is shaped like Wordnik's `Facet` model, with a list of
+        `{'value': name, 'count': n}` facet values, largest first.
+        """
+        return self.facets.counts()
+
+    def by_part_of_speech(self, include, exclude=(), skip=0, limit=10):
+        """Return a page of headwords filtered by part of speech.
+
+        `include` and `exclude` are names like "noun" or "verb-transitive".
+        Headwords come out in sorted order, and only the ones on the page
+        are read from the dictionary.
+        """
+        if isinstance(include, str):
+            include = (include,)
+        if isinstance(exclude, str):
+            exclude = (exclude,)
+        ids = self.facets.query(include, exclude)
+        return [self.binary[i] for i in islice(ids, skip, skip + limit)]
+
+    def search(self, query: str, min_length=0, max_length=float('inf'),
+               part_of_speech=None, skip=0, limit=10):
+        """Return a page of headwords that match a wildcard pattern.
+
+        This takes the same filters as `WordsApi.searchWords`. The part of
+        speech is a name, like "noun", or an OPTED label, like "v. t.".
+        """
+        ids = self.patterns.search(query, self.binary, min_length, max_length)
+        if part_of_speech:
+            ids = (i for i in ids
+                   if self.has_part_of_speech(i, part_of_speech))
+        return [self.binary[i] for i in islice(ids, skip, skip + limit)]
+
+    def random_words(self, count: int, part_of_speech=None, min_length=1,
+                     max_length=None, min_definitions=1):
+        """Return a list of up to `count` distinct random headwords.
+
+        `part_of_speech` is a name like "noun" or "verb-transitive". The
+        filters work like the ones on `WordsApi.getRandomWords`. This returns
+        nothing until `build()` has saved the random word index.
+        """
+        index = self.index('random', build=False)
+        if index is None:
+            return []
+        ids = index.sample(count, part_of_speech, min_length, max_length,
+                           min_definitions)
+        return [self.binary[i] for i in ids]
+
+    def random_word(self, **filters):
+        """Return a random headword, or None if nothing fits the filters."""
+        words = self.random_words(1, **filters)
+        return words[0] if words else None
+
+    def anagrams(self, word: str):
+        """Return the other headwords spelled with exactly the same letters."""
+        key = anagrams.letters(word)
+        return [self.binary[i] for i in self.anagram_index.anagrams(word)
+                if anagrams.letters(self.binary[i]) != key]
+
+    def from_tiles(self, tiles: str, min_length=2, limit=20):
+        """Return a list of `(headword, score)` that a rack of tiles spells.
+
+        `?` stands for a blank tile. Words are ranked by Scrabble score.
+        """
+        found = self.anagram_index.from_tiles(tiles, min_length, limit)
+        return [(self.binary[i], score) for i, score in found]
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""This module finds the headwords that definitions refer to.
+
+OPTED definitions often point to other entries, like "See Abate." or "Same
+as Manila hemp." Those references are capitalized in the text, so any
+capitalized run of words that is a headword, and isn't just the start of a
+sentence, is linked.
+
+The links are found once, at build time, with the Aho-Corasick algorithm.
+Its automaton is built over the words of every headword, instead of their
+characters, so matches always start and end on word boundaries, and each
+definition is scanned in a single pass no matter how many headwords there
+are. The spans are saved by headword id, so rendering an entry only slices
+its text.
+"""
+import mmap
+import re
+import struct
+from array import array
+from collections import deque
+
+MAGIC = b'WRLINKS1'
+HEADER = struct.Struct('<8sII')  # magic, number of headwords, number of links
+# Words, including ones with inner hyphens or apostrophes, like "o'clock"
+TOKEN = re.compile(r"[^\W\d_]+(?:['\-][^\W\d_]+)*")
+# The characters that end a sentence. The OPTED text lost most of its
+# opening parentheses, so ")" often ends a sentence too.
+_SENTENCE_END = '.!?:;)'
+
+
+class Automaton:
+    """An Aho-Corasick automaton over the words of a list of headwords."""
+
+    def __init__(self, words):
+        """Build the automaton from a sequence of headwords.
+
+        `words` is indexed by headword id. Headwords that aren't made of
+        plain words separated by spaces, or that are a single letter, are
+        left out.
+        """
+        self.goto = [{}]
+        self.output = [-1]
+        self.depth = [0]
+        for i, word in enumerate(words):
+            tokens = TOKEN.findall(word)
+            if ' '.join(tokens) != word or len(word) < 2:
+                continue
+            node = 0
+            for token in tokens:
+                token = token.lower()
+                if token not in self.goto[node]:
+                    self.goto.append({})
+                    self.output.append(-1)
+                    self.depth.append(self.depth[node] + 1)
+                    self.goto[node][token] = len(self.goto) - 1
+                node = self.goto[node][token]
+            if self.output[node] == -1:
+                self.output[node] = i
+        self._link()
+
+    def _link(self):
+        """Compute the failure links, breadth first."""
+        self.fail = [0] * len(self.goto)
+        # The nearest node down the failure chain that ends a headword
+        self.next_output = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self.goto[node].items():
+                state = self.fail[node]
+                while state and token not in self.goto[state]:
+                    state = self.fail[state]
+                fail = self.goto[state].get(token, 0)
+                self.fail[child] = fail
+                self.next_output[child] = (
+                    fail if self.output[fail] != -1
+                    else self.next_output[fail])
+                queue.append(child)
+
+    def matches(self, tokens):
+        """Return an iterator of `(first, last, id)` for each match.
+
+        `first` and `last` are the positions of the first and last tokens
+        of a headword in `tokens`.
+        """
+        state = 0
+        for n, token in enumerate(tokens):
+            token = token.lower()
+            while state and token not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(token, 0)
+            node = state if self.output[state] != -1 else (
+                self.next_output[state])
+            while node:
+                yield n - self.depth[node] + 1, n, self.output[node]
+                node = self.next_output[node]
+
+
+def find_links(text: str, automaton, own=-1):
+    """Return a list of `(start, end, id)` for the references in a text.
+
+    Matches that are only part of a longer capitalized name, like "United"
+    in "United States", are skipped. Overlapping matches are resolved by
+    taking the leftmost, then the longest. `own` is the id of the entry the
+    text is from, which is never linked to itself.
+    """
+    spans = [m.span() for m in TOKEN.finditer(text)]
+    tokens = [text[start:end] for start, end in spans]
+
+    def starts_sentence(start):
+        # The start of the text is empty, which counts as a sentence end.
+        return text[max(start - 8, 0):start].rstrip()[-1:] in _SENTENCE_END
+
+    def in_name(n, gap):
+        # Is token n a capitalized word, with only spaces between it and a
+        # match? A word like "See" that starts a sentence doesn't count.
+        return (0 <= n < len(tokens) and tokens[n][0].isupper()
+                and not gap.strip() and not starts_sentence(spans[n][0]))
+
+    found = []
+    for first, last, i in automaton.matches(tokens):
+        start, end = spans[first][0], spans[last][1]
+        if (i == own or not tokens[first][0].isupper()
+                or starts_sentence(start)):
+            continue
+        if (first > 0 and in_name(first - 1, text[spans[first - 1][1]:start])
+                or last + 1 < len(tokens)
+                and in_name(last + 1, text[end:spans[last + 1][0]])):
+            continue
+        found.append((start, end, i))
+    found.sort(key=lambda f: (f[0], -f[1]))
+    links = []
+    for start, end, i in found:
+        if not links or start >= links[-1][1]:
+            links.append((start, end, i))
+    return links
+
+
+def compile_links(binary, dest: str):
+    """Find the references in every definition and save them.
+
+    The file holds, in native byte order, the position of each headword's
+    first link, followed by every link as four unsigned ints: the number of
+    the definition, the start and end of the text, and the headword id.
+    """
+    automaton = Automaton(list(binary.headwords()))
+    starts = array('I', [0])
+    data = array('I')
+    for i in range(len(binary)):
+        for n, d in enumerate(binary.definitions(i)):
+            for start, end, target in find_links(d['text'], automaton, i):
+                data.extend((n, start, end, target))
+        starts.append(len(data) // 4)
+    with open(dest, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(binary), len(data) // 4))
+        starts.tofile(f)
+        data.tofile(f)
+
+
+def segments(text: str, links):
+    """Split a text into a list of `[text, headword]` pieces.
+
+    `links` is a list of `(start, end, headword)`. Pieces that aren't links
+    have None for their headword.
+    """
+    pieces = []
+    position = 0
+    for start, end, word in links:
+        if start > position:
+            pieces.append([text[position:start], None])
+        pieces.append([text[start:end], word])
+        position = end
+    if position < len(text):
+        pieces.append([text[position:], None])
+    return pieces
+
+
+class LinkIndex:
+    """Look up the saved references of each headword's definitions."""
+
+    FILE = 'links.bin'
+
+    def __init__(self, path: str):
+        """Open and map the given file."""
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, links = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError('%s is not a link index.' % path)
+        view = memoryview(self._map)[HEADER.size:].cast('I')
+        self._starts = view[:count + 1]
+        self._links = view[count + 1:count + 1 + links * 4]
+
+    def links(self, i: int):
+        """Return a list of `(definition, start, end, id)` for a headword."""
+        data = self._links[self._starts[i] * 4:self._starts[i + 1] * 4]
+        return [tuple(data[n:n + 4]) for n in range(0, len(data), 4)]
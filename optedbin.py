@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""This module compiles the OPTED shards into a single binary dictionary.
+
+The JSON shards in `opted/` are easy to read and edit, but looking up a single
+word means parsing a whole shard. The compiled file stores a sorted table of
+headwords and a blob of definitions, so it can be memory-mapped and searched
+with a binary search without loading it into memory. When WordRoom only
+ships the compressed container (see `optedzip`), it's compiled from that
+instead.
+
+The file layout is:
+
+    header         magic bytes and the number of headwords (N)
+    word offsets   N + 1 little-endian uint32 offsets into the word blob
+    entry offsets  N + 1 little-endian uint32 offsets into the entry blob
+    word blob      UTF-8 headwords, sorted by their bytes
+    entry blob     compact JSON lists of definitions, in the same order
+
+Run this module directly to (re)build the file.
+"""
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+from config import OPTED_DIR, OPTED_BIN_FILE, OPTED_ZIP_FILE
+
+MAGIC = b'WROPTED1'
+HEADER = struct.Struct('<8sI')
+OFFSET = struct.Struct('<I')
+
+
+def shard_letter(word: str):
+    """Return the letter of the shard that a word is stored in."""
+    return re.sub('[^a-zA-Z]', '', word)[:1].lower()
+
+
+def load_shards(src_dir=OPTED_DIR, zip_path=OPTED_ZIP_FILE):
+    """Return a dictionary of every headword and its definitions.
+
+    A few headwords appear in more than one shard. Their definitions are
+    merged, with the ones from the word's own shard listed first. If there
+    are no shards, such as when WordRoom only ships the compressed
+    container, the entries are read from the container instead.
+    """
+    shards = sorted(glob.glob(os.path.join(src_dir, '*.json')))
+    if not shards and os.path.exists(zip_path):
+        # optedzip imports this module, so it can't be imported at the top
+        import optedzip
+        return dict(optedzip.OptedZip(zip_path).entries())
+    found = {}
+    for path in shards:
+        letter = os.path.basename(path)[:-5]
+        with open(path, 'r') as f:
+            for word, definitions in json.load(f).items():
+                found.setdefault(word, []).append((letter, definitions))
+    entries = {}
+    for word, parts in found.items():
+        letter = shard_letter(word)
+        parts.sort(key=lambda part: part[0] != letter)
+        entries[word] = [d for part in parts for d in part[1]]
+    return entries
+
+
+def is_stale(path=OPTED_BIN_FILE, src_dir=OPTED_DIR, zip_path=OPTED_ZIP_FILE):
+    """Return True if the compiled file is missing or older than its source.
+
+    The source is the shards, or the compressed container if there are no
+    shards. If there's neither, this is always False.
+    """
+    sources = glob.glob(os.path.join(src_dir, '*.json'))
+    if not sources and os.path.exists(zip_path):
+        sources = [zip_path]
+    if not sources:
+        return False
+    try:
+        built = os.path.getmtime(path)
+    except FileNotFoundError:
+        return True
+    return any(os.path.getmtime(source) > built for source in sources)
+
+
+def compile_opted(src_dir=OPTED_DIR, dest=OPTED_BIN_FILE):
+    """Compile the JSON shards, or the container, into a binary dictionary.
+
+    The file is written to a temporary path first and then moved into place,
+    so readers never see a partially written file.
+    """
+    entries = load_shards(src_dir)
+    words = sorted(word.encode('utf-8') for word in entries)
+    word_offsets = [0]
+    entry_offsets = [0]
+    blobs = []
+    for word in words:
+        word_offsets.append(word_offsets[-1] + len(word))
+        definitions = entries[word.decode('utf-8')]
+        blob = json.dumps(definitions, separators=(',', ':')).encode('utf-8')
+        entry_offsets.append(entry_offsets[-1] + len(blob))
+        blobs.append(blob)
+    count = len(words)
+    tmp = dest + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, count))
+        f.write(struct.pack('<%dI' % (count + 1), *word_offsets))
+        f.write(struct.pack('<%dI' % (count + 1), *entry_offsets))
+        f.write(b''.join(words))
+        f.write(b''.join(blobs))
+    os.replace(tmp, dest)
+    return count
+
+
+class OptedBinary:
+    """A read-only, memory-mapped view of the compiled dictionary.
+
+    Headwords are identified by their position in the sorted table. Other
+    offline indexes use these ids to refer to headwords compactly.
+    """
+
+    def __init__(self, path=OPTED_BIN_FILE):
+        """Open and map the given file."""
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError('%s is not a compiled OPTED file.' % path)
+        self._word_table = HEADER.size
+        self._entry_table = self._word_table + (self.count + 1) * OFFSET.size
+        self._word_blob = self._entry_table + (self.count + 1) * OFFSET.size
+        self._entry_blob = self._word_blob + self._offset(self._word_table,
+                                                          self.count)
+
+    def __len__(self):
+        """Return the number of headwords."""
+        return self.count
+
+    def __getitem__(self, i: int):
+        """Return the headword with the given id."""
+        if not 0 <= i < self.count:
+            raise IndexError('headword id out of range')
+        return self.headword(i)
+
+    def __contains__(self, word):
+        """Return True if the word is a headword."""
+        return self.find(word) != -1
+
+    def _offset(self, table: int, i: int):
+        return OFFSET.unpack_from(self._map, table + i * OFFSET.size)[0]
+
+    def _word_bytes(self, i: int):
+        start = self._word_blob + self._offset(self._word_table, i)
+        end = self._word_blob + self._offset(self._word_table, i + 1)
+        return self._map[start:end]
+
+    def headword(self, i: int):
+        """Return the headword with the given id."""
+        return self._word_bytes(i).decode('utf-8')
+
+    def headwords(self):
+        """Return an iterator of every headword, in sorted order."""
+        return (self.headword(i) for i in range(self.count))
+
+    def bisect(self, key: bytes):
+        """Return the id of the first headword that isn't less than `key`."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, word: str):
+        """Return the id of a headword, or -1 if it isn't in the dictionary."""
+        key = word.encode('utf-8')
+        i = self.bisect(key)
+        if i < self.count and self._word_bytes(i) == key:
+            return i
+        return -1
+
+    def definitions(self, i: int):
+        """Return the list of definitions for the headword with an id."""
+        start = self._entry_blob + self._offset(self._entry_table, i)
+        end = self._entry_blob + self._offset(self._entry_table, i + 1)
+        return json.loads(self._map[start:end].decode('utf-8'))
+
+    def entry_size(self, i: int):
+        """Return the size of a headword's definitions, in bytes."""
+        return (self._offset(self._entry_table, i + 1)
+                - self._offset(self._entry_table, i))
+
+    def entry_sizes(self, start: int, end: int):
+        """Return the sizes of the definitions of the ids in a range."""
+        offsets = struct.unpack_from(
+            '<%dI' % (end - start + 1), self._map,
+            self._entry_table + start * OFFSET.size)
+        return [b - a for a, b in zip(offsets, offsets[1:])]
+
+    def lookup(self, word: str):
+        """Return the list of definitions for a word, or an empty list."""
+        i = self.find(word)
+        if i == -1:
+            return []
+        return self.definitions(i)
+
+    def close(self):
+        """Unmap the file."""
+        self._map.close()
+
+
+if __name__ == '__main__':
+    print('Compiled %d headwords into %s.' % (compile_opted(), OPTED_BIN_FILE))
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""This module stores the OPTED dictionary in an optional SQLite database.
+
+The database has one row per definition, indexed by headword and by part of
+speech, and a full-text (FTS5) index over the definition text. This makes
+queries like "every noun starting with 'ca'" or "definitions mentioning
+'heights'" cheap, where the JSON shards would need a full scan.
+
+Run this module directly to (re)build the database.
+"""
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+from config import OPTED_DIR, OPTED_DB_FILE
+from optedbin import load_shards
+
+SCHEMA = '''
+CREATE TABLE definitions (
+    id INTEGER PRIMARY KEY,
+    headword TEXT NOT NULL,
+    partOfSpeech TEXT NOT NULL,
+    text TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX definitions_headword ON definitions (headword, seq);
+CREATE INDEX definitions_pos ON definitions (partOfSpeech, headword);
+'''
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE definitions_fts USING fts5(
+    text, content='definitions', content_rowid='id'
+);
+INSERT INTO definitions_fts (definitions_fts) VALUES ('rebuild');
+'''
+
+
+def compile_opted_sql(src_dir=OPTED_DIR, dest=OPTED_DB_FILE):
+    """Build the SQLite database from the JSON shards.
+
+    Some builds of SQLite don't include FTS5. In that case, the database is
+    built without it and text searches fall back to a slower LIKE query.
+    """
+    entries = load_shards(src_dir)
+    tmp = dest + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        rows = ((word, d['partOfSpeech'], d['text'], seq)
+                for word in sorted(entries)
+                for seq, d in enumerate(entries[word]))
+        conn.executemany('INSERT INTO definitions '
+                         '(headword, partOfSpeech, text, seq) '
+                         'VALUES (?, ?, ?, ?)', rows)
+        conn.commit()
+        try:
+            conn.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            print('Building without full-text search:', e)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, dest)
+    return len(entries)
+
+
+def fts_query(text: str):
+    """Return an FTS5 query that matches every word of some plain text.
+
+    Each word is quoted as an FTS5 string, so punctuation and words like
+    "AND" are searched for instead of being read as query syntax.
+    """
+    return ' '.join('"%s"' % word.replace('"', '""')
+                    for word in text.split())
+
+
+def path_to_uri(path: str):
+    """Escape a file path for use in an SQLite URI."""
+    return os.path.abspath(path).replace('?', '%3f').replace('#', '%23')
+
+
+class ConnectionPool:
+    """A small pool of read-only connections shared between threads.
+
+    SQLite connections are cheap, but not free, and each one keeps its own
+    page cache. Reusing them keeps repeated lookups warm.
+    """
+
+    def __init__(self, path: str, size=4):
+        """Set up the pool. Connections are opened as they're needed."""
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        uri = 'file:%s?mode=ro' % path_to_uri(self.path)
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, and return it to the pool when finished."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class OptedSQL:
+    """Query the SQLite dictionary through a pool of connections."""
+
+    def __init__(self, path=OPTED_DB_FILE, pool_size=4):
+        """Open the database. Raise sqlite3.Error if it isn't usable."""
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            tables = {row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'definitions' not in tables:
+            raise sqlite3.DatabaseError('%s has no definitions.' % path)
+        self.has_fts = 'definitions_fts' in tables
+
+    def _query(self, sql: str, params=()):
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def lookup(self, word: str):
+        """Return the list of definitions for a word, or an empty list."""
+        rows = self._query('SELECT partOfSpeech, text FROM definitions '
+                           'WHERE headword = ? ORDER BY seq', (word,))
+        return [{'partOfSpeech': r['partOfSpeech'], 'text': r['text']}
+                for r in rows]
+
+    def by_part_of_speech(self, part_of_speech: str, skip=0, limit=50):
+        """Return headwords with a definition for the given part of speech."""
+        rows = self._query('SELECT DISTINCT headword FROM definitions '
+                           'WHERE partOfSpeech = ? ORDER BY headword '
+                           'LIMIT ? OFFSET ?', (part_of_speech, limit, skip))
+        return [r['headword'] for r in rows]
+
+    def by_prefix(self, prefix: str, limit=20):
+        """Return headwords that begin with the given prefix."""
+        rows = self._query('SELECT DISTINCT headword FROM definitions '
+                           'WHERE headword >= ? AND headword < ? '
+                           'ORDER BY headword LIMIT ?',
+                           (prefix, prefix + '\U0010ffff', limit))
+        return [r['headword'] for r in rows]
+
+    def search(self, text: str, limit=20):
+        """Return (headword, definition) pairs whose text matches a query.
+
+        With FTS5, definitions must contain every word of the query, and
+        results are ranked by BM25. Without it, the query is matched as a
+        plain substring.
+        """
+        if self.has_fts:
+            query = fts_query(text)
+            if not query:
+                return []
+            rows = self._query('SELECT d.headword, d.text '
+                               'FROM definitions_fts f '
+                               'JOIN definitions d ON d.id = f.rowid '
+                               'WHERE definitions_fts MATCH ? '
+                               'ORDER BY f.rank LIMIT ?', (query, limit))
+        else:
+            rows = self._query('SELECT headword, text FROM definitions '
+                               'WHERE text LIKE ? LIMIT ?',
+                               ('%' + text + '%', limit))
+        return [(r['headword'], r['text']) for r in rows]
+
+    def close(self):
+        """Close the pooled connections."""
+        self.pool.close()
+
+
+if __name__ == '__main__':
+    count = compile_opted_sql()
+    print('Compiled %d headwords into %s.' % (count, OPTED_DB_FILE))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""This module packs the OPTED dictionary into a compressed container.
+
+The JSON shards are mostly whitespace and repeated keys, so they compress
+very well. Compressing the whole dictionary as one stream would mean
+decompressing all of it for every lookup, though. Instead, the entries are
+sorted and split into blocks of about 64 KB, and each block is compressed
+on its own. An index of the first headword in each block tells a lookup
+which single block to decompress.
+
+The file layout is:
+
+    header   magic bytes, the codec, the number of blocks and the index size
+    index    a JSON list of [first headword, offset, length] for each block
+    blocks   compressed JSON objects of headwords and their definitions
+
+Run this module directly to (re)build the file.
+"""
+import bisect
+import json
+import lzma
+import os
+import struct
+import zlib
+from cache import LRUCache
+from config import OPTED_DIR, OPTED_ZIP_FILE
+from optedbin import load_shards
+
+MAGIC = b'WROPTZ01'
+HEADER = struct.Struct('<8scII')
+BLOCK_SIZE = 64 * 1024
+CODECS = {b'z': (lambda data: zlib.compress(data, 9), zlib.decompress),
+          b'x': (lzma.compress, lzma.decompress)}
+
+
+def compile_opted_zip(src_dir=OPTED_DIR, dest=OPTED_ZIP_FILE, codec=b'z'):
+    """Compress the JSON shards into a block container.
+
+    `codec` is b'z' for zlib, or b'x' for lzma, which is smaller but slower
+    to decompress.
+    """
+    compress = CODECS[codec][0]
+    entries = load_shards(src_dir)
+    blocks = []
+    block = {}
+    block_size = 0
+    for word in sorted(entries):
+        entry = json.dumps(entries[word], separators=(',', ':'))
+        if block and block_size + len(entry) > BLOCK_SIZE:
+            blocks.append(block)
+            block = {}
+            block_size = 0
+        block[word] = entries[word]
+        block_size += len(word) + len(entry)
+    if block:
+        blocks.append(block)
+    index = []
+    data = []
+    offset = 0
+    for block in blocks:
+        packed = compress(json.dumps(block, separators=(',', ':'))
+                          .encode('utf-8'))
+        index.append([min(block), offset, len(packed)])
+        data.append(packed)
+        offset += len(packed)
+    index_blob = json.dumps(index, separators=(',', ':')).encode('utf-8')
+    tmp = dest + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, codec, len(blocks), len(index_blob)))
+        f.write(index_blob)
+        f.write(b''.join(data))
+    os.replace(tmp, dest)
+    return len(entries)
+
+
+class OptedZip:
+    """Look up words in a compressed block container.
+
+    The most recently used blocks are kept decompressed, since nearby words
+    are often looked up together.
+    """
+
+    def __init__(self, path=OPTED_ZIP_FILE, cached_blocks=4):
+        """Open the file and read its block index."""
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, codec, count, index_size = HEADER.unpack(
+                f.read(HEADER.size))
+            if magic != MAGIC or codec not in CODECS:
+                raise ValueError('%s is not an OPTED container.' % path)
+            index = json.loads(f.read(index_size).decode('utf-8'))
+        self._decompress = CODECS[codec][1]
+        self._data_start = HEADER.size + index_size
+        self.first_words = [block[0] for block in index]
+        self._spans = [(block[1], block[2]) for block in index]
+        self.blocks = LRUCache(cached_blocks, sizeof=lambda block: 1)
+
+    def __len__(self):
+        """Return the number of blocks."""
+        return len(self.first_words)
+
+    def block_of(self, word: str):
+        """Return the number of the block that would hold a word."""
+        return max(bisect.bisect_right(self.first_words, word) - 1, 0)
+
+    def block(self, n: int):
+        """Return a decompressed block as a dictionary of entries."""
+        block = self.blocks.get(n)
+        if block is None:
+            offset, length = self._spans[n]
+            with open(self.path, 'rb') as f:
+                f.seek(self._data_start + offset)
+                data = self._decompress(f.read(length))
+            block = json.loads(data.decode('utf-8'))
+            self.blocks.put(n, block)
+        return block
+
+    def entries(self):
+        """Return an iterator of every (headword, definitions), in order."""
+        for n in range(len(self)):
+            yield from self.block(n).items()
+
+    def lookup(self, word: str):
+        """Return the list of definitions for a word, or an empty list."""
+        if not self.first_words:
+            return []
+        return self.block(self.block_of(word)).get(word) or []
+
+
+if __name__ == '__main__':
+    count = compile_opted_zip()
+    print('Compressed %d headwords into %s.' % (count, OPTED_ZIP_FILE))
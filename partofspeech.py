@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""This module maps OPTED part of speech labels to Wordnik-style names.
+
+OPTED labels are abbreviations copied from the original dictionary, like
+"v. t. & i." or "p. pr. & vb. n.", and they aren't always consistent. The
+names are the ones Wordnik uses, like "verb-transitive", so offline and
+online filters can take the same values.
+"""
+import re
+
+# Keys are labels with the spaces and periods removed
+NAMES = {
+    'n': ('noun',),
+    'nsing': ('noun',),
+    'nfem': ('noun',),
+    'nf': ('noun',),
+    'nm': ('noun',),
+    'nmasc': ('noun',),
+    'npl': ('noun', 'noun-plural'),
+    'pl': ('noun', 'noun-plural'),
+    'ncollect': ('noun', 'noun-plural'),
+    'sing': ('noun',),
+    'a': ('adjective',),
+    'adj': ('adjective',),
+    'pa': ('adjective',),
+    'compar': ('adjective',),
+    'superl': ('adjective',),
+    'supperl': ('adjective',),
+    'v': ('verb',),
+    'vt': ('verb', 'verb-transitive'),
+    't': ('verb', 'verb-transitive'),
+    'vi': ('verb', 'verb-intransitive'),
+    'i': ('verb', 'verb-intransitive'),
+    'imp': ('verb', 'past-tense'),
+    'pp': ('verb', 'past-participle'),
+    'ppr': ('verb', 'present-participle'),
+    'vbn': ('noun', 'verbal-noun'),
+    'adv': ('adverb',),
+    'prep': ('preposition',),
+    'pron': ('pronoun',),
+    'conj': ('conjunction',),
+    'interj': ('interjection',),
+    'pref': ('affix', 'prefix'),
+    'prefix': ('affix', 'prefix'),
+    'aprefix': ('affix', 'prefix'),
+    'suff': ('affix', 'suffix'),
+    'suffix': ('affix', 'suffix'),
+}
+_SEPARATORS = re.compile(r'&|,|/|\bor\b')
+
+
+def classify(label: str):
+    """Return the set of names for an OPTED part of speech label.
+
+    Unknown labels return an empty set.
+    """
+    names = set()
+    for part in _SEPARATORS.split(label.lower()):
+        names.update(NAMES.get(re.sub(r'[\s.]', '', part), ()))
+    return names
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""This module searches headwords with wildcard patterns, like "c?t*".
+
+`?` matches any single character and `*` matches any run of characters,
+like in crossword solvers. This is the offline counterpart of
+`WordsApi.searchWords`.
+
+The index stores sorted lists of headword ids for every word length, and
+for every letter at each of the first and last few positions. A pattern is
+turned into a set of those lists, and only the words in all of them are
+checked against the full pattern.
+"""
+import bisect
+import heapq
+import json
+import re
+import struct
+from array import array
+
+MAGIC = b'WRPATT01'
+HEADER = struct.Struct('<8sI')
+# Positions after these, counted from either end, aren't indexed.
+MAX_POSITION = 6
+
+
+def _keys(word: str):
+    """Return the index keys of a word."""
+    keys = ['L%d' % len(word)]
+    for i, c in enumerate(word[:MAX_POSITION]):
+        keys.append('P%d%s' % (i, c))
+    for i, c in enumerate(reversed(word[-MAX_POSITION:])):
+        keys.append('S%d%s' % (i, c))
+    return keys
+
+
+def compile_patterns(words, dest: str):
+    """Build the pattern index for a sequence of headwords and save it.
+
+    The file holds a JSON directory of `key: [offset, count]` followed by
+    one array of unsigned ints with every id list.
+    """
+    lists = {}
+    for i, word in enumerate(words):
+        for key in _keys(word):
+            lists.setdefault(key, []).append(i)
+    data = array('I')
+    directory = {}
+    for key, ids in lists.items():
+        directory[key] = [len(data), len(ids)]
+        data.extend(ids)
+    blob = json.dumps(directory, separators=(',', ':')).encode('utf-8')
+    with open(dest, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(blob)))
+        f.write(blob)
+        data.tofile(f)
+
+
+class PatternIndex:
+    """Find headwords that match wildcard patterns."""
+
+    FILE = 'patterns.bin'
+
+    def __init__(self, path: str):
+        """Load the index from a file."""
+        with open(path, 'rb') as f:
+            magic, size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('%s is not a pattern index.' % path)
+            self.directory = json.loads(f.read(size).decode('utf-8'))
+            self.data = array('I')
+            self.data.frombytes(f.read())
+        self._view = memoryview(self.data)
+
+    def ids(self, key: str):
+        """Return the sorted id list for an index key."""
+        offset, count = self.directory.get(key, (0, 0))
+        return self._view[offset:offset + count]
+
+    def _lists(self, pattern: str):
+        """Return the id lists that every match of a pattern is in."""
+        lists = []
+        if '*' not in pattern:
+            lists.append(self.ids('L%d' % len(pattern)))
+            head, tail = pattern, pattern
+        else:
+            head = pattern[:pattern.index('*')]
+            tail = pattern[pattern.rindex('*') + 1:]
+        for i, c in enumerate(head[:MAX_POSITION]):
+            if c != '?':
+                lists.append(self.ids('P%d%s' % (i, c)))
+        for i, c in enumerate(reversed(tail[-MAX_POSITION:])):
+            if c != '?':
+                lists.append(self.ids('S%d%s' % (i, c)))
+        return lists
+
+    def _lengths(self, min_length: int, max_length: int):
+        """Return an iterator of the ids of words within a length range."""
+        lengths = sorted(int(key[1:]) for key in self.directory
+                         if key[0] == 'L')
+        return heapq.merge(*(self.ids('L%d' % n) for n in lengths
+                             if min_length <= n <= max_length))
+
+    def search(self, pattern: str, words, min_length=0,
+               max_length=float('inf')):
+        """Return an iterator of the ids of headwords that match a pattern.
+
+        `words` is the sequence the index was built from. Ids come out in
+        sorted order, and are generated lazily, so paging through the
+        results only checks as many words as it needs to.
+        """
+        pattern = pattern.casefold()
+        matcher = re.compile(to_regex(pattern)).match
+        min_length = max(min_length, len(pattern.replace('*', '')))
+        lists = sorted(self._lists(pattern), key=len)
+        if lists:
+            driver, others = lists[0], lists[1:]
+        else:  # the pattern is only wildcards
+            driver, others = self._lengths(min_length, max_length), []
+        for i in driver:
+            if all(_contains(ids, i) for ids in others):
+                word = words[i]
+                if (min_length <= len(word) <= max_length
+                        and matcher(word)):
+                    yield i
+
+
+def to_regex(pattern: str):
+    """Return a regular expression for a wildcard pattern."""
+    parts = {'?': '.', '*': '.*'}
+    return ''.join(parts.get(c) or re.escape(c) for c in pattern) + r'\Z'
+
+
+def _contains(ids, i: int):
+    n = bisect.bisect_left(ids, i)
+    return n < len(ids) and ids[n] == i
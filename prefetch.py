@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""This module looks up definitions before the user opens them.
+
+The Prefetcher runs a few background threads that work through a queue of
+words, like the rows on screen and the links in the open definition. Their
+results are kept in a bounded cache, so opening one of those words doesn't
+wait on the network. The queue is bounded too: when it's full, the words
+that are least likely to be opened are dropped.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Queue priorities. Lower priorities go first.
+LINK = 0  # linked from the open definition
+VISIBLE = 1  # shown on the table
+RECENT = 2  # recently added to the history
+# After a failed lookup, the workers wait this long, doubling up to the max
+BACKOFF = 5
+MAX_BACKOFF = 5 * 60
+
+
+class Prefetcher:
+    """Call a lookup function for each queued word in background threads."""
+
+    def __init__(self, fetch, store, workers=2, max_queue=30):
+        """Create the prefetcher.
+
+        `fetch` is called with each word and returns its result, or None if
+        there's nothing worth keeping. It raises an exception if the word
+        couldn't be looked up, which makes every worker back off for a
+        while. Results are put in `store`, which is a cache like
+        `cache.LRUCache`.
+        """
+        self.fetch = fetch
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self.failed = 0
+        self.dropped = 0
+        self.backoff = 0
+        # A heap of (priority, -order, word), like the Prewarmer's
+        self._queue = []
+        self._order = itertools.count()
+        self._priorities = {}  # word: (priority, -order)
+        self._running = set()
+        self._retry_at = 0
+        self._foreground = 0
+        self._idle = threading.Event()
+        self._idle.set()
+        self._ready = threading.Condition()
+        self._threads = []
+
+    def get(self, word):
+        """Return a prefetched result, or None if there isn't one."""
+        value = self.store.get(word)
+        with self._ready:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def schedule(self, words, priority=VISIBLE):
+        """Queue words, or move them up the queue.
+
+        Among words with the same priority, the last one queued goes first.
+        """
+        with self._ready:
+            for word in words:
+                if word in self.store or word in self._running:
+                    continue
+                entry = (priority, -next(self._order))
+                if entry >= self._priorities.get(word, (float('inf'),)):
+                    continue
+                self._priorities[word] = entry
+                heapq.heappush(self._queue, entry + (word,))
+            if len(self._priorities) > self.max_queue:
+                self._trim()
+            self._ready.notify_all()
+
+    def _trim(self):
+        # Keep the first max_queue words, and rebuild the heap without the
+        # rest or any stale entries.
+        keep = heapq.nsmallest(self.max_queue, self._priorities.items(),
+                               key=lambda item: item[1])
+        self.dropped += len(self._priorities) - len(keep)
+        self._priorities = dict(keep)
+        self._queue = [entry + (word,) for word, entry in keep]
+        heapq.heapify(self._queue)
+
+    @contextmanager
+    def foreground(self):
+        """Pause the prefetcher while a lookup runs in this block."""
+        with self._ready:
+            self._foreground += 1
+            self._idle.clear()
+        try:
+            yield
+        finally:
+            with self._ready:
+                self._foreground -= 1
+                if not self._foreground:
+                    self._idle.set()
+
+    def start(self):
+        """Start the background threads, if they aren't running already."""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next(self):
+        with self._ready:
+            while True:
+                wait = self._retry_at - time.monotonic()
+                if wait > 0:
+                    self._ready.wait(wait)
+                    continue
+                if not self._queue:
+                    self._ready.wait()
+                    continue
+                priority, order, word = heapq.heappop(self._queue)
+                # Skip stale entries left behind by schedule()
+                if self._priorities.get(word) == (priority, order):
+                    del self._priorities[word]
+                    self._running.add(word)
+                    return word, priority
+
+    def _run(self):
+        while True:
+            word, priority = self._next()
+            self._idle.wait()
+            try:
+                value = self.fetch(word)
+            except Exception as e:
+                print('Prefetching %r failed: %s' % (word, e))
+                with self._ready:
+                    self.failed += 1
+                    self.backoff = min(max(self.backoff * 2, BACKOFF),
+                                       MAX_BACKOFF)
+                    self._retry_at = time.monotonic() + self.backoff
+                    self._running.discard(word)
+                # Try the word again after the backoff.
+                self.schedule([word], priority)
+                continue
+            if value is not None:
+                self.store.put(word, value)
+            with self._ready:
+                self.fetched += 1
+                self.backoff = 0
+                self._running.discard(word)
+
+    def stats(self):
+        """Return a dictionary of the queue, store and hit rate."""
+        with self._ready:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'fetched': self.fetched,
+                    'failed': self.failed,
+                    'dropped': self.dropped,
+                    'queued': len(self._priorities),
+                    'stored': len(self.store),
+                    'backoff': self.backoff}
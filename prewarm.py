@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""This module loads parts of the offline dictionary before they're needed.
+
+The Prewarmer runs a low-priority background thread that works through a
+queue of shard letters. Letters are ordered by how likely they are to be
+looked up, and the worker waits whenever a foreground lookup is running.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# How long the worker rests between shards, so the UI thread gets a turn
+PAUSE = 0.05
+
+
+class Prewarmer:
+    """Call a loader for each queued key in a background thread."""
+
+    def __init__(self, load):
+        """Create the prewarmer. `load` is called with each key in turn.
+
+        Keys can be queued again after they're loaded, so `load` should
+        return quickly if its key is already in memory. It returns True if it
+        loaded anything.
+        """
+        self.load = load
+        self.loaded = 0
+        # A heap of (priority, -order, key), so among equal priorities, the
+        # most recently queued key goes first.
+        self._queue = []
+        self._order = itertools.count()
+        self._priorities = {}
+        self._foreground = 0
+        self._idle = threading.Event()
+        self._idle.set()
+        self._ready = threading.Condition()
+        self._thread = None
+
+    def schedule(self, weights: dict):
+        """Queue keys in order of their weights, from highest to lowest."""
+        for key, weight in weights.items():
+            self.prioritize(key, -weight)
+
+    def prioritize(self, key, priority=float('-inf')):
+        """Queue a key, or move it up the queue. Lower priorities go first.
+
+        By default, the key goes to the front. This is meant for the letter
+        the user is typing in the search field.
+        """
+        with self._ready:
+            if priority >= self._priorities.get(key, float('inf')):
+                return
+            self._priorities[key] = priority
+            heapq.heappush(self._queue, (priority, -next(self._order), key))
+            self._ready.notify()
+
+    @contextmanager
+    def foreground(self):
+        """Pause the prewarmer while a lookup runs in this block."""
+        with self._ready:
+            self._foreground += 1
+            self._idle.clear()
+        try:
+            yield
+        finally:
+            with self._ready:
+                self._foreground -= 1
+                if not self._foreground:
+                    self._idle.set()
+
+    def start(self):
+        """Start the background thread, if it isn't running already."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _next(self):
+        with self._ready:
+            while True:
+                while not self._queue:
+                    self._ready.wait()
+                priority, _, key = heapq.heappop(self._queue)
+                # Skip stale entries left behind by prioritize()
+                if self._priorities.get(key) == priority:
+                    del self._priorities[key]
+                    return key
+
+    def _run(self):
+        while True:
+            key = self._next()
+            self._idle.wait()
+            if self.load(key):
+                self.loaded += 1
+                time.sleep(PAUSE)
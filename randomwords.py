@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""This module picks random words from the offline dictionary.
+
+It's the offline counterpart of `WordsApi.getRandomWord` and
+`WordsApi.getRandomWords`. For each part of speech, the index stores the
+headword ids sorted by length, with the position where each length starts.
+Any length range is a contiguous slice of that array, so a random word is
+picked with a single random index instead of by filtering the dictionary.
+"""
+import json
+import random
+import struct
+from array import array
+
+MAGIC = b'WRRAND01'
+HEADER = struct.Struct('<8sII')  # magic, number of headwords, directory size
+# The name of the list with every headword in it
+ANY = ''
+# The name of the list with every headword, sorted by definition count
+BY_DEFINITIONS = '#definitions'
+# How many picks in a row can fail the definition count filter, before
+# falling back to filtering the whole slice
+RETRIES = 20
+
+
+def compile_random(binary, facet_index, dest: str):
+    """Build the random word index for an `optedbin.OptedBinary`.
+
+    The part of speech lists and definition counts come from its
+    `facets.FacetIndex`, so no definitions are read here. The file holds a
+    JSON directory of `name: [offset, size, {key: start}]`, the number of
+    definitions of each headword (up to 255), and then one array of
+    unsigned ints with every id list.
+    """
+    counts = facet_index.definition_counts
+    lists = {ANY: list(range(len(binary)))}
+    for name in facet_index.directory:
+        lists[name] = list(facet_index.ids(name))
+    data = array('I')
+    directory = {}
+
+    def add(name, ids, key):
+        ids.sort(key=key)
+        starts = {}
+        for n, i in enumerate(ids):
+            starts.setdefault(key(i), n)
+        directory[name] = [len(data), len(ids), starts]
+        data.extend(ids)
+
+    for name, ids in lists.items():
+        add(name, ids, lambda i: len(binary[i]))
+    add(BY_DEFINITIONS, list(lists[ANY]), counts.__getitem__)
+    blob = json.dumps(directory, separators=(',', ':')).encode('utf-8')
+    with open(dest, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(binary), len(blob)))
+        f.write(blob)
+        counts.tofile(f)
+        data.tofile(f)
+
+
+class RandomIndex:
+    """Sample random headwords with filters."""
+
+    FILE = 'random.bin'
+
+    def __init__(self, path: str):
+        """Load the index from a file."""
+        with open(path, 'rb') as f:
+            magic, count, size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('%s is not a random word index.' % path)
+            directory = json.loads(f.read(size).decode('utf-8'))
+            self.definition_counts = array('B')
+            self.definition_counts.fromfile(f, count)
+            self.data = array('I')
+            self.data.frombytes(f.read())
+        self.lists = {}
+        for name, (offset, length, starts) in directory.items():
+            starts = sorted((int(n), start) for n, start in starts.items())
+            self.lists[name] = (offset, length, starts)
+
+    def parts_of_speech(self):
+        """Return a list of the names that words can be filtered by."""
+        return sorted(name for name in self.lists
+                      if name not in (ANY, BY_DEFINITIONS))
+
+    def _slice(self, name, minimum, maximum):
+        """Return the (start, end) positions in `data` of a filter.
+
+        `minimum` and `maximum` are the range of the key that the list is
+        sorted by.
+        """
+        if name not in self.lists:
+            return 0, 0
+        offset, length, starts = self.lists[name]
+        start, end = length, length
+        for n, position in starts:
+            if n >= minimum and start == length:
+                start = position
+            if maximum is not None and n > maximum:
+                end = position
+                break
+        return offset + start, offset + max(start, end)
+
+    def sample(self, count=1, part_of_speech=None, min_length=1,
+               max_length=None, min_definitions=1):
+        """Return a list of up to `count` distinct random headword ids.
+
+        The part of speech and length filters are a slice of a precomputed
+        array, so each pick is constant time. So is the definition filter by
+        itself. When it's combined with the others, words with too few
+        definitions are rejected and picked again.
+        """
+        if min_definitions > 1 and not part_of_speech and (
+                min_length <= 1 and max_length is None):
+            start, end = self._slice(BY_DEFINITIONS, min_definitions, None)
+            min_definitions = 0
+        else:
+            start, end = self._slice(part_of_speech or ANY, min_length,
+                                     max_length)
+        picked = set()
+        failures = 0
+        while len(picked) < min(count, end - start) and failures < RETRIES:
+            i = self.data[random.randrange(start, end)]
+            if i in picked:
+                continue
+            if self.definition_counts[i] < min_definitions:
+                failures += 1
+                continue
+            failures = 0
+            picked.add(i)
+        if len(picked) < count and failures >= RETRIES:
+            # The filter is too strict for guessing, so list every match.
+            pool = [i for i in self.data[start:end]
+                    if self.definition_counts[i] >= min_definitions
+                    and i not in picked]
+            picked.update(random.sample(pool, min(count - len(picked),
+                                                  len(pool))))
+        return list(picked)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""This module is an offline reverse dictionary.
+
+It answers queries like "fear of heights" by searching the text of every
+definition and ranking headwords with BM25. This mirrors what
+`WordsApi.reverseDictionary` does online.
+
+The index is inverted: each term points to a posting list of the headword
+ids whose definitions contain it. Posting lists are stored as the gaps
+between sorted ids, encoded as variable-length bytes, so most ids take a
+single byte.
+"""
+import heapq
+import json
+import math
+import re
+import struct
+from array import array
+
+MAGIC = b'WRREVRS1'
+HEADER = struct.Struct('<8sII')  # magic, number of documents, vocab length
+# BM25 parameters. These are the usual defaults.
+K1 = 1.2
+B = 0.75
+STOPWORDS = frozenset('''a an and are as at be by for from has in is it its
+of on or that the this to was which with'''.split())
+# Words that are part of how a question is asked, not what it's about
+QUERY_STOPWORDS = STOPWORDS | {'word', 'words', 'meaning', 'means', 'mean',
+                               'term', 'describing', 'describes', 'someone',
+                               'something'}
+_TOKENS = re.compile('[a-z]+')
+
+
+def stem(term: str):
+    """Strip a plural "s" from a term, so "heights" matches "height"."""
+    if len(term) > 3 and term.endswith('s') and not term.endswith('ss'):
+        return term[:-1]
+    return term
+
+
+def tokenize(text: str, stopwords=STOPWORDS):
+    """Return a list of the stemmed terms in some text."""
+    return [stem(t) for t in _TOKENS.findall(text.lower())
+            if t not in stopwords]
+
+
+def _encode(numbers, out: array):
+    for n in numbers:
+        while n >= 0x80:
+            out.append(n & 0x7f | 0x80)
+            n >>= 7
+        out.append(n)
+
+
+def _decode(data, start: int, count: int):
+    result = []
+    n = shift = 0
+    i = start
+    while len(result) < count:
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            result.append(n)
+            n = shift = 0
+    return result, i
+
+
+def compile_reverse(binary, dest: str):
+    """Build the inverted index for an `optedbin.OptedBinary` and save it.
+
+    The file holds a JSON vocabulary of `term: [df, offset]`, the length of
+    each document, then the postings. Each posting list is a run of id gaps
+    followed by a run of term frequencies, both variable-length encoded.
+    """
+    postings = {}
+    lengths = array('H')
+    for i in range(len(binary)):
+        terms = tokenize(' '.join(d['text'] for d in binary.definitions(i)))
+        lengths.append(min(len(terms), 0xffff))
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            postings.setdefault(term, []).append((i, count))
+    data = array('B')
+    vocab = {}
+    for term in sorted(postings):
+        docs = postings[term]
+        vocab[term] = [len(docs), len(data)]
+        previous = 0
+        gaps = []
+        for doc, _ in docs:
+            gaps.append(doc - previous)
+            previous = doc
+        _encode(gaps, data)
+        _encode((count for _, count in docs), data)
+    vocab_blob = json.dumps(vocab, separators=(',', ':')).encode('utf-8')
+    with open(dest, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(binary), len(vocab_blob)))
+        f.write(vocab_blob)
+        lengths.tofile(f)
+        data.tofile(f)
+
+
+class ReverseIndex:
+    """Search definitions with a compiled inverted index."""
+
+    FILE = 'reverse.bin'
+
+    def __init__(self, path: str):
+        """Load the index from a file."""
+        with open(path, 'rb') as f:
+            magic, count, vocab_size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('%s is not a reverse index.' % path)
+            self.vocab = json.loads(f.read(vocab_size).decode('utf-8'))
+            self.lengths = array('H')
+            self.lengths.fromfile(f, count)
+            self.data = array('B', f.read())
+        self.count = count
+        self.average_length = sum(self.lengths) / max(count, 1)
+
+    def postings(self, term: str):
+        """Return a list of (headword id, term frequency) for a term."""
+        if term not in self.vocab:
+            return []
+        df, offset = self.vocab[term]
+        gaps, offset = _decode(self.data, offset, df)
+        counts, _ = _decode(self.data, offset, df)
+        ids = []
+        previous = 0
+        for gap in gaps:
+            previous += gap
+            ids.append(previous)
+        return list(zip(ids, counts))
+
+    def search(self, query: str, limit=10):
+        """Return a list of (headword id, score) that best match a query."""
+        scores = {}
+        for term in set(tokenize(query, QUERY_STOPWORDS)):
+            postings = self.postings(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            for i, tf in postings:
+                norm = 1 - B + B * self.lengths[i] / self.average_length
+                score = idf * tf * (K1 + 1) / (tf + K1 * norm)
+                scores[i] = scores.get(i, 0) + score
+        return heapq.nlargest(limit, scores.items(), key=lambda s: s[1])
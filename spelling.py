@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""This module suggests spellings for words that aren't in the dictionary.
+
+It uses the symmetric delete algorithm from SymSpell. At build time, every
+headword is reduced to the strings you get by deleting up to two characters
+from it. At lookup time, the same is done to the misspelled word, and any
+headword that shares one of those strings is a candidate. Candidates are then
+checked with a real edit distance.
+
+Only the first few characters of each word are used to generate the deletes,
+which keeps the index small. Suggestions aren't lost that way, since any two
+words within the edit distance have prefixes within it too; there are just
+more candidates to check against the full spelling.
+"""
+import bisect
+import mmap
+import struct
+import zlib
+from array import array
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 5
+MAGIC = b'WRSPELL2'
+HEADER = struct.Struct('<8sII')
+
+
+def deletes(word: str, distance=MAX_DISTANCE):
+    """Return the set of strings made by deleting up to `distance` chars."""
+    word = word[:PREFIX_LENGTH]
+    found = {word}
+    edge = {word}
+    for _ in range(distance):
+        edge = {w[:i] + w[i + 1:] for w in edge for i in range(len(w))}
+        found |= edge
+    return found
+
+
+def _hash(text: str):
+    # Python's hash() is randomized per process, so it can't be saved.
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def edit_distance(a: str, b: str, limit=MAX_DISTANCE):
+    """Return the optimal string alignment distance between two strings.
+
+    This counts insertions, deletions, substitutions and swaps of adjacent
+    characters. Anything over `limit` is returned as `limit + 1`.
+    """
+    over = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return over
+    # A shared prefix or suffix doesn't change the distance, and candidates
+    # usually share a long prefix with the word.
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while (end < len(a) - start and end < len(b) - start
+           and a[-1 - end] == b[-1 - end]):
+        end += 1
+    a = a[start:len(a) - end]
+    b = b[start:len(b) - end]
+    # Only cells within `limit` of the diagonal can be within the limit, so
+    # the rest are left at `over`.
+    previous = None
+    row = [min(j, over) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [over] * (len(b) + 1)
+        if i <= limit:
+            row[0] = i
+        low = max(1, i - limit)
+        high = min(len(b), i + limit)
+        for j in range(low, high + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous[j] + 1, row[j - 1] + 1,
+                         previous[j - 1] + cost, over)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]):
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row[low - 1:high + 1]) > limit:
+            return over
+    return min(row[-1], over)
+
+
+def compile_spelling(words, dest: str):
+    """Build the delete index for a sequence of words and save it.
+
+    `words` is indexed by headword id. The file holds three arrays of
+    unsigned ints: the distinct delete hashes in sorted order, where each
+    hash's ids start, and the ids of the headwords with each delete.
+    """
+    # Each pair is packed into one int, which sorts much faster than tuples.
+    pairs = sorted({_hash(d) << 32 | i
+                    for i, word in enumerate(words)
+                    for d in deletes(word)})
+    hashes = array('I')
+    starts = array('I')
+    ids = array('I', (pair & 0xffffffff for pair in pairs))
+    for n, pair in enumerate(pairs):
+        if not hashes or hashes[-1] != pair >> 32:
+            hashes.append(pair >> 32)
+            starts.append(n)
+    starts.append(len(ids))
+    with open(dest, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(hashes), len(ids)))
+        hashes.tofile(f)
+        starts.tofile(f)
+        ids.tofile(f)
+
+
+class SpellIndex:
+    """Look up spelling suggestions in a compiled delete index.
+
+    The file is memory-mapped, so only the pages that a lookup touches are
+    read. The arrays are stored in the device's native byte order.
+    """
+
+    FILE = 'spelling.bin'
+
+    def __init__(self, path: str):
+        """Open and map the given file."""
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, id_count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError('%s is not a spelling index.' % path)
+        view = memoryview(self._map)[HEADER.size:].cast('I')
+        self._hashes = view[:count]
+        self._starts = view[count:count * 2 + 1]
+        self._ids = view[count * 2 + 1:count * 2 + 1 + id_count]
+
+    def _candidates(self, word: str):
+        found = set()
+        hashes = self._hashes
+        for d in deletes(word):
+            key = _hash(d)
+            n = bisect.bisect_left(hashes, key)
+            if n < len(hashes) and hashes[n] == key:
+                found.update(self._ids[self._starts[n]:self._starts[n + 1]])
+        return found
+
+    def suggest(self, word: str, binary, limit=5):
+        """Return the ids of the closest headwords to a word.
+
+        `binary` is the `optedbin.OptedBinary` the index was built from, so
+        candidates can be checked against their full spelling. Results are
+        ranked by edit distance, then by the size of their entries, since
+        common words tend to have more definitions.
+        """
+        ranked = []
+        for i in self._candidates(word):
+            distance = edit_distance(word, binary[i])
+            if 0 < distance <= MAX_DISTANCE:
+                ranked.append((distance, -binary.entry_size(i), i))
+        ranked.sort()
+        return [r[2] for r in ranked[:limit]]
@@ -21,7 +21,10 @@ class Vocabulary:
         # _words[0] is words with notes. _words[1] is history
         self._words = [{}, {}]
         self.query = ''  # used for searching the list
+        self.completions = []  # dictionary words shown under the query
         self.fulltext_toggle = False
+        # Called with the word of each vocabulary row as the table draws it
+        self.row_shown = None
         self.data_file = data_file
         self.data_id = None  # Identifies sync conflicts
         self.load_json_file()
@@ -137,6 +140,17 @@ class Vocabulary:
         To "unset" the query, just set an empty string.
         """
         self.query = query.strip()
+        if not self.query:
+            self.completions = []
+
+    def set_completions(self, words: list):
+        """Set the dictionary words suggested under the search query.
+
+        The query itself already has its own row, so it's left out, even if
+        it was typed with different capitals.
+        """
+        query = self.query.casefold()
+        self.completions = [w for w in words if w.casefold() != query]
 
     def _filter_query(self, word):
         hasdef = False
@@ -158,6 +172,14 @@ class Vocabulary:
             words = self._words[section].keys()
         return sorted(words, key=lambda s: s.casefold())
 
+    def recent_words(self, count: int):
+        """Return the words most recently added to history, newest first."""
+        return list(self._words[1])[:-count - 1:-1]
+
+    def all_words(self):
+        """Return a list of every word, with or without notes."""
+        return list(self._words[0]) + list(self._words[1])
+
     def delete_word(self, section: int, word: str):
         """Delete a word."""
         word = word.strip()
@@ -186,12 +208,15 @@ class Vocabulary:
         return (x[1] for x in wordlist)
 
     def random_word(self):
-        """Return a random word with notes."""
+        """Return a random word with notes, or None if there aren't any."""
+        if not self._words[0]:
+            return None
         return random.choice(list(self._words[0].keys()))
 
     # ---- Tableview methods
-    # the `_query` variable activates a hack that inserts a section with search
-    # suggestions. I might add actual suggestions from the WordNik API sometime
+    # the `query` variable activates a hack that inserts a section with search
+    # suggestions. The first row looks up the query itself, and the rest are
+    # completions from the offline dictionary.
 
     def tableview_number_of_sections(self, tableview):
         """Return the number of sections."""
@@ -212,14 +237,24 @@ class Vocabulary:
     def tableview_number_of_rows(self, tableview, section):
         """Return the number of rows in the section."""
         if self.query and section == 0:
-            # The search suggestions always have 1 row.
-            return 1
+            # The search suggestions have 1 row plus any completions.
+            return 1 + len(self.completions)
         elif self.query:
             # The extra section doesn't exist in the data, so we delete it
             # before calling other methods
             section -= 1
         return self.count_words(section)
 
+    def word_for_row(self, section, row):
+        """Return the word shown on the given section/row."""
+        if self.query and section == 0 and row == 0:
+            return self.query
+        elif self.query and section == 0:
+            return self.completions[row - 1]
+        elif self.query:
+            section -= 1
+        return self.list_words(section=section)[row]
+
     def tableview_cell_for_row(self, tableview, section, row):
         """Create and return a cell for the given section/row."""
         if self.query and section == 0 and row == 0:
@@ -231,12 +266,21 @@ class Vocabulary:
             cell.image_view.image = ui.Image.named('iob:ios7_search_24')
             cell.accessory_type = 'disclosure_indicator'
             return cell
+        elif self.query and section == 0:
+            # Adds a cell for a completion from the dictionary
+            cell = ui.TableViewCell()
+            cell.text_label.text = self.completions[row - 1]
+            cell.image_view.image = ui.Image.named('iob:ios7_search_24')
+            cell.accessory_type = 'disclosure_indicator'
+            return cell
         elif self.query:
             # The extra section doesn't exist in the data, so we delete it
             # before calling other methods
             section -= 1
         cell = ui.TableViewCell()
         cell.text_label.text = self.list_words(section=section)[row]
+        if self.row_shown:
+            self.row_shown(cell.text_label.text)
         if section == 0:
             img = 'iob:document_text_24'
         elif section == 1:
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+"""An asyncio version of the Swagger API client.
+
+AsyncApiClient sends requests over asyncio streams instead of blocking
+sockets, so one event loop can run many lookups at once without a thread for
+each one. AsyncApi wraps any of the generated API classes, like WordApi, so
+every endpoint method has an awaitable version:
+
+    client = AsyncApiClient(apiKey, apiUrl)
+    wordApi = AsyncApi(WordApi.WordApi, client)
+    definitions = await wordApi.getDefinitions('irony', limit=5)
+
+The generated methods still check their arguments and build the requests,
+and the responses go through the same `deserialize` logic and models.
+"""
+
+import asyncio
+import email.parser
+import http.client
+import io
+import random
+import ssl
+import time
+import urllib.error
+import urllib.parse
+
+from .swagger import (ApiClient, BodyDecoder, CHUNK_SIZE, isServerFailure,
+                      requestPriority)
+
+
+class AsyncConnectionPool:
+    """Keep-alive connections for asyncio streams.
+
+    This works like swagger.ConnectionPool, but it also limits the number
+    of requests in flight to each host to `maxConnections`. Extra requests
+    wait their turn instead of opening more connections. Streams and
+    semaphores belong to one event loop, so when a pool is used from a new
+    loop, like the next asyncio.run(), it starts over."""
+
+    def __init__(self, maxConnections=8, idleTimeout=30, connectTimeout=None,
+                 readTimeout=None):
+        self.maxConnections = maxConnections
+        self.idleTimeout = idleTimeout
+        self.connectTimeout = connectTimeout
+        self.readTimeout = readTimeout
+        self.created = 0
+        self.reused = 0
+        self._idle = {}  # (scheme, host): [(reader, writer, time released)]
+        self._limits = {}  # (scheme, host): asyncio.Semaphore
+        self._loop = None  # the event loop that _idle and _limits belong to
+
+    def _checkLoop(self):
+        """Drop the connections and semaphores of a previous event loop."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self.close()
+            self._limits.clear()
+            self._loop = loop
+
+    def limit(self, scheme, host):
+        """Return the semaphore that limits requests to a host."""
+        self._checkLoop()
+        key = (scheme, host)
+        if key not in self._limits:
+            self._limits[key] = asyncio.Semaphore(self.maxConnections)
+        return self._limits[key]
+
+    async def getConnection(self, scheme, host):
+        """Return a (reader, writer, reused) tuple for a scheme and host."""
+        self._checkLoop()
+        now = time.monotonic()
+        idle = self._idle.get((scheme, host), [])
+        while idle:
+            reader, writer, released = idle.pop()
+            if now - released < self.idleTimeout and not reader.at_eof():
+                self.reused += 1
+                return reader, writer, True
+            writer.close()
+        parts = urllib.parse.urlsplit('//' + host)
+        if scheme == 'https':
+            context = ssl.create_default_context()
+            port = parts.port or 443
+        else:
+            context = None
+            port = parts.port or 80
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, port, ssl=context),
+            self.connectTimeout)
+        self.created += 1
+        return reader, writer, False
+
+    def releaseConnection(self, scheme, host, reader, writer):
+        """Return a connection to the pool after its response is read."""
+        idle = self._idle.setdefault((scheme, host), [])
+        if len(idle) < self.maxConnections:
+            idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    def close(self):
+        """Close every idle connection."""
+        for idle in self._idle.values():
+            for _, writer, _ in idle:
+                try:
+                    writer.close()
+                except RuntimeError:
+                    pass  # its event loop is already closed
+        self._idle.clear()
+
+
+class AsyncResponse:
+    """The status and headers of a response, like http.client's."""
+
+    def __init__(self, version, status, reason, headers):
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        # True if the body ends when the server closes the connection
+        self.readToClose = False
+
+    def willClose(self):
+        """Return True if the server will close the connection."""
+        connection = self.headers.get('Connection', '').lower()
+        return self.readToClose or connection == 'close' or (
+            self.version == 'HTTP/1.0' and connection != 'keep-alive')
+
+
+class AsyncApiClient(ApiClient):
+    """An API client with an awaitable version of callAPI.
+
+    It shares the request building, caching, circuit breaker and
+    deserialize logic of ApiClient. The blocking callAPI still works too."""
+
+    def __init__(self, apiKey=None, apiServer=None, pool=None,
+                 asyncPool=None):
+        ApiClient.__init__(self, apiKey, apiServer, pool)
+        self.asyncPool = asyncPool or AsyncConnectionPool(
+            connectTimeout=self.pool.connectTimeout,
+            readTimeout=self.pool.readTimeout)
+
+    async def callAPIAsync(self, resourcePath, method, queryParams, postData,
+                           headerParams=None):
+        """Send a request and return its parsed JSON, like callAPI."""
+
+        url, headers, data = self.prepareRequest(resourcePath, method,
+                                                 queryParams, postData,
+                                                 headerParams)
+        if method != 'GET':
+            return await self.fetchAsync(method, url, headers, data)
+        cacheKey = self.cacheKey(resourcePath, url, headerParams)
+        return await self.singleFlight.doAsync(
+            self.flightKey(url, headerParams),
+            lambda: self.fetchAsync(method, url, headers, data, cacheKey))
+
+    async def fetchAsync(self, method, url, headers, data, cacheKey=None):
+        """Send a prepared request, using the cache if there's a key."""
+
+        # The cache is a local file, so it's quick enough to use directly.
+        if cacheKey:
+            cached = self.cache.get(cacheKey)
+            if cached is not None:
+                return cached
+
+        try:
+            response, body = await self.sendWithRetriesAsync(method, url,
+                                                             headers, data)
+        except urllib.error.URLError:
+            if cacheKey:
+                cached = self.cache.get(cacheKey, stale=True)
+                if cached is not None:
+                    return cached
+            raise
+        data = self.decodeResponse(response.headers, body)
+
+        if cacheKey and data is not None:
+            self.cache.put(cacheKey, data)
+
+        return data
+
+    async def sendWithRetriesAsync(self, method, url, headers, data):
+        """Send a request, retrying GETs, like sendWithRetries."""
+
+        if self.limiter:
+            self.startRateLimitSync()
+            await self.acquireAsync(requestPriority.get())
+        self.checkBreaker()
+        attempt = 0
+        while True:
+            try:
+                result = await self.sendRequestAsync(method, url, headers,
+                                                     data)
+            except urllib.error.URLError as e:
+                self.observeRateLimit(e)
+                if not isServerFailure(e):
+                    self.breaker.recordSuccess()
+                    raise
+                if method == 'GET' and attempt < self.maxRetries:
+                    delay = self.retryDelay * 2 ** attempt
+                    await asyncio.sleep(random.uniform(0, delay))
+                    attempt += 1
+                    continue
+                self.breaker.recordFailure()
+                raise
+            except Exception:
+                self.breaker.recordFailure()
+                raise
+            self.breaker.recordSuccess()
+            self.observeRateLimit(result[0])
+            return result
+
+    async def acquireAsync(self, priority):
+        """Wait until the rate limiter lets a request through."""
+
+        start = time.monotonic()
+        while True:
+            wait = self.limiter.reserve(priority, time.monotonic() - start)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def sendRequestAsync(self, method, url, headers, data):
+        """Send a request over a pooled stream, like sendRequest."""
+
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        lines = ['%s %s HTTP/1.1' % (method, path),
+                 'Host: %s' % parts.netloc,
+                 'Accept-Encoding: gzip, deflate']
+        lines += ['%s: %s' % (key, value) for key, value in headers.items()]
+        if data:
+            lines.append('Content-Length: %d' % len(data))
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        request += data or b''
+
+        idempotent = method in ('GET', 'HEAD')
+        pool = self.asyncPool
+        async with pool.limit(parts.scheme, parts.netloc):
+            while True:
+                try:
+                    reader, writer, reused = await pool.getConnection(
+                        parts.scheme, parts.netloc)
+                except (OSError, asyncio.TimeoutError) as e:
+                    raise urllib.error.URLError(e)
+                try:
+                    writer.write(request)
+                    await writer.drain()
+                    response, body = await asyncio.wait_for(
+                        self.readResponse(reader, method), pool.readTimeout)
+                except asyncio.IncompleteReadError as e:
+                    writer.close()
+                    # The server may have closed an idle connection. Only
+                    # GETs and HEADs are safe to send again, like in
+                    # sendRequest.
+                    if reused and idempotent and not e.partial:
+                        continue
+                    raise urllib.error.URLError(e)
+                except (OSError, asyncio.TimeoutError, ValueError,
+                        http.client.HTTPException) as e:
+                    writer.close()
+                    if reused and idempotent and isinstance(
+                            e, (ConnectionResetError, BrokenPipeError)):
+                        continue
+                    raise urllib.error.URLError(e)
+                break
+            if response.willClose():
+                writer.close()
+            else:
+                pool.releaseConnection(parts.scheme, parts.netloc, reader,
+                                       writer)
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status,
+                                         response.reason, response.headers,
+                                         io.BytesIO(body))
+        return response, body
+
+    async def readResponse(self, reader, method):
+        """Read a response's status, headers and decompressed body."""
+
+        statusLine = (await reader.readuntil(b'\r\n')).decode('latin-1')
+        version, status, reason = (statusLine.strip().split(' ', 2)
+                                   + [''])[:3]
+        if not version.startswith('HTTP/'):
+            raise http.client.BadStatusLine(statusLine)
+        headerBlock = await reader.readuntil(b'\r\n\r\n')
+        headers = email.parser.BytesParser(
+            _class=http.client.HTTPMessage).parsebytes(headerBlock)
+        response = AsyncResponse(version, int(status), reason, headers)
+
+        decoder = BodyDecoder(headers.get('Content-Encoding', ''))
+        chunks = []
+        if method == 'HEAD' or response.status in (204, 304):
+            pass
+        elif 'chunked' in headers.get('Transfer-Encoding', '').lower():
+            while True:
+                size = await reader.readuntil(b'\r\n')
+                size = int(size.split(b';')[0].strip(), 16)
+                if size == 0:
+                    # Skip any trailers, up to the final blank line.
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                chunks.append(decoder.decode(await reader.readexactly(size)))
+                await reader.readexactly(2)
+        elif headers.get('Content-Length') is not None:
+            remaining = int(headers['Content-Length'])
+            while remaining:
+                chunk = await reader.readexactly(min(remaining, CHUNK_SIZE))
+                chunks.append(decoder.decode(chunk))
+                remaining -= len(chunk)
+        else:
+            response.readToClose = True
+            while True:
+                chunk = await reader.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunks.append(decoder.decode(chunk))
+        chunks.append(decoder.flush())
+        body = b''.join(chunks)
+        self.countBytes(decoder.received, len(body))
+        return response, body
+
+
+class _RequestRecorder:
+    """Stands in for the API client while a generated method runs.
+
+    It records the request that the method builds and the class that it
+    would deserialize the response into, instead of sending anything."""
+
+    def __init__(self, client):
+        self.client = client
+        self.request = None
+        self.objClass = None
+
+    def toPathValue(self, obj):
+        return self.client.toPathValue(obj)
+
+    def callAPI(self, resourcePath, method, queryParams, postData,
+                headerParams=None):
+        self.request = (resourcePath, method, queryParams, postData,
+                        headerParams)
+        return True  # so the method goes on to deserialize
+
+    def deserialize(self, obj, objClass):
+        self.objClass = objClass
+
+
+class AsyncApi:
+    """Awaitable versions of every method of a generated API class.
+
+    `apiClass` is a class like WordApi.WordApi, and `client` is an
+    AsyncApiClient. Each method takes the same arguments as the original."""
+
+    def __init__(self, apiClass, client):
+        self.apiClass = apiClass
+        self.client = client
+
+    def __getattr__(self, name):
+        method = getattr(self.apiClass, name)
+        if name.startswith('_') or not callable(method):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            recorder = _RequestRecorder(self.client)
+            getattr(self.apiClass(recorder), name)(*args, **kwargs)
+            response = await self.client.callAPIAsync(*recorder.request)
+            if not response or recorder.objClass is None:
+                return None
+            return self.client.deserialize(response, recorder.objClass)
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
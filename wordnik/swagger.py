@@ -6,29 +6,569 @@ templates."""
 
 import sys
 import os
+import asyncio
+import contextlib
+import contextvars
 import re
-import urllib.request, urllib.error, urllib.parse
+import urllib.error, urllib.parse
 import http.client
+import io
 import json
 import datetime
+import hashlib
+import math
+import random
+import threading
+import time
+import zlib
 
 from .models import *
 
 
+# How much of a response body to read and decompress at a time
+CHUNK_SIZE = 16 * 1024
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections, shared between threads.
+
+    A connection is only used by one request at a time. When the request is
+    done, the connection goes back to the pool, and the next request to the
+    same host reuses it instead of making a new TCP and TLS handshake. Up to
+    `maxSize` idle connections are kept for each host, and any that have
+    been idle for `idleTimeout` seconds are closed, since servers drop them
+    after a while anyway."""
+
+    def __init__(self, maxSize=4, idleTimeout=30, connectTimeout=None,
+                 readTimeout=None):
+        self.maxSize = maxSize
+        self.idleTimeout = idleTimeout
+        # Seconds to wait for a connection, and then for each read from it.
+        # None waits forever.
+        self.connectTimeout = connectTimeout
+        self.readTimeout = readTimeout
+        self.created = 0
+        self.reused = 0
+        self._idle = {}  # (scheme, host): [(connection, time released)]
+        self._lock = threading.Lock()
+
+    def getConnection(self, scheme, host):
+        """Return a (connection, reused) tuple for a scheme and host."""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get((scheme, host), [])
+            while idle:
+                connection, released = idle.pop()
+                if now - released < self.idleTimeout:
+                    self.reused += 1
+                    return connection, True
+                connection.close()
+            self.created += 1
+        if scheme == 'https':
+            connectionClass = http.client.HTTPSConnection
+        else:
+            connectionClass = http.client.HTTPConnection
+        return connectionClass(host, timeout=self.connectTimeout), False
+
+    def connect(self, connection):
+        """Open a new connection, then switch it to the read timeout."""
+        connection.connect()
+        connection.sock.settimeout(self.readTimeout)
+
+    def releaseConnection(self, scheme, host, connection):
+        """Return a connection to the pool after its response is read."""
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self.maxSize:
+                idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            for idle in self._idle.values():
+                for connection, _ in idle:
+                    connection.close()
+            self._idle.clear()
+
+
+class CircuitOpenError(urllib.error.URLError):
+    """Raised instead of sending a request while the server is unhealthy."""
+
+
+class CircuitBreaker:
+    """Stop sending requests to a server after it fails repeatedly.
+
+    After `failureThreshold` failures in a row, the circuit opens, and
+    requests fail right away with CircuitOpenError instead of waiting on the
+    server. After `resetTimeout` seconds, it's half open: one request is let
+    through as a trial, and its result closes or reopens the circuit.
+
+    Listeners are called with the old and new state whenever it changes."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failureThreshold=3, resetTimeout=30):
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.openedAt = 0
+        self._trialRunning = False
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def addListener(self, listener):
+        """Call `listener(oldState, newState)` when the state changes."""
+        self._listeners.append(listener)
+
+    def _setState(self, state):
+        # Returns the change, so listeners can be called outside the lock.
+        oldState, self.state = self.state, state
+        return (oldState, state) if oldState != state else None
+
+    def _notify(self, change):
+        if change:
+            for listener in self._listeners:
+                listener(*change)
+
+    def retryAfter(self):
+        """Return how many seconds are left until the next trial request."""
+        return max(self.openedAt + self.resetTimeout - time.monotonic(), 0)
+
+    def allow(self):
+        """Return True if a request may be sent now."""
+        change = None
+        with self._lock:
+            if self.state == self.OPEN and not self.retryAfter():
+                change = self._setState(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                allowed = not self._trialRunning
+                self._trialRunning = True
+            else:
+                allowed = self.state == self.CLOSED
+        self._notify(change)
+        return allowed
+
+    def recordSuccess(self):
+        """Record that the server answered."""
+        with self._lock:
+            self.failures = 0
+            self._trialRunning = False
+            change = self._setState(self.CLOSED)
+        self._notify(change)
+
+    def recordFailure(self):
+        """Record that the server failed or couldn't be reached."""
+        change = None
+        with self._lock:
+            self.failures += 1
+            self._trialRunning = False
+            if (self.state == self.HALF_OPEN
+                    or self.failures >= self.failureThreshold):
+                self.openedAt = time.monotonic()
+                change = self._setState(self.OPEN)
+        self._notify(change)
+
+
+class RateLimitError(urllib.error.URLError):
+    """Raised instead of sending a request that would overspend the quota."""
+
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+# The priority of the requests sent from the current thread or task
+requestPriority = contextvars.ContextVar('requestPriority',
+                                         default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def background():
+    """Send the requests made inside this block at background priority."""
+    token = requestPriority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        requestPriority.reset(token)
+
+
+class RateLimiter:
+    """Share an API key's call quota between interactive and background work.
+
+    Interactive requests may use the whole quota. Background requests are
+    paced by a token bucket that spreads what's left of the quota over the
+    rest of its window, and they stop when only `quotaReserve` calls are
+    left, or while an interactive request is waiting. A request that would
+    have to wait longer than its priority's `maxDelay` raises RateLimitError
+    instead, so background work is deferred for a while and then dropped.
+
+    The quota is estimated from `callsPerHour` until it's synced with the
+    server, either from an ApiTokenStatus or from rate limit headers."""
+
+    def __init__(self, callsPerHour=100, burst=10, quotaReserve=20,
+                 syncInterval=300, maxDelay=None):
+        self.burst = burst
+        self.quotaReserve = quotaReserve
+        self.syncInterval = syncInterval
+        self.maxDelay = maxDelay or {INTERACTIVE: 2, BACKGROUND: 30}
+        self.rate = max(callsPerHour - quotaReserve, 0) / 3600
+        self.tokens = burst
+        self.remaining = None  # calls left in the quota, if known
+        self.resetAt = None  # when the quota resets, if known
+        self.pausedUntil = 0
+        self.lastSync = None
+        self.granted = 0
+        self.deferred = 0
+        self.dropped = 0
+        self._updated = time.monotonic()
+        self._interactiveWaitUntil = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self.resetAt is not None and now >= self.resetAt:
+            self.remaining = self.resetAt = None
+
+    def _wait(self, priority, now):
+        # Returns how long a request of this priority must wait for a call.
+        if self.pausedUntil > now:
+            return self.pausedUntil - now
+        floor = 0 if priority == INTERACTIVE else self.quotaReserve
+        if self.remaining is not None and self.remaining <= floor:
+            return self.resetAt - now if self.resetAt else math.inf
+        if priority == INTERACTIVE:
+            return 0
+        if self._interactiveWaitUntil > now:
+            return self._interactiveWaitUntil - now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate if self.rate else math.inf
+        return 0
+
+    def reserve(self, priority=INTERACTIVE, waited=0):
+        """Take a call from the budget, or return how long to wait for one.
+
+        Returns 0 if the request may be sent now. `waited` is how long the
+        request has waited so far. Raises RateLimitError if it would wait
+        longer than its maxDelay."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._wait(priority, now)
+            if wait:
+                if waited + wait > self.maxDelay[priority]:
+                    self.dropped += 1
+                    raise RateLimitError(
+                        'the API call budget is spent, retrying in %s'
+                        % ('%d seconds' % math.ceil(wait)
+                           if wait < math.inf else 'a while'))
+                if not waited:
+                    self.deferred += 1
+                if priority == INTERACTIVE:
+                    self._interactiveWaitUntil = max(
+                        self._interactiveWaitUntil, now + wait)
+                return wait
+            # Interactive requests can overdraw the bucket, which holds back
+            # background ones until it refills.
+            self.tokens = max(self.tokens - 1, -self.burst)
+            if self.remaining is not None:
+                self.remaining -= 1
+            self.granted += 1
+            return 0
+
+    def acquire(self, priority=INTERACTIVE):
+        """Wait until a request may be sent, like reserve()."""
+        start = time.monotonic()
+        while True:
+            wait = self.reserve(priority, time.monotonic() - start)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def needsSync(self):
+        """Return True if it's time to fetch the ApiTokenStatus again.
+
+        Calling this marks the sync as started, so that only one caller
+        does it."""
+        with self._lock:
+            now = time.monotonic()
+            if (self.lastSync is not None
+                    and now - self.lastSync < self.syncInterval):
+                return False
+            self.lastSync = now
+            return True
+
+    def sync(self, remainingCalls, resetsInMillis):
+        """Update the quota from an ApiTokenStatus."""
+        if remainingCalls is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.remaining = remainingCalls
+            if resetsInMillis:
+                self.resetAt = now + resetsInMillis / 1000
+                self.rate = (max(remainingCalls - self.quotaReserve, 0)
+                             / max(resetsInMillis / 1000, 1))
+
+    def observe(self, headers, limited=False):
+        """Update the quota from the rate limit headers of a response.
+
+        `limited` means the server refused the request with a 429 status."""
+        remaining = (headers.get('X-RateLimit-Remaining-Hour')
+                     or headers.get('X-RateLimit-Remaining'))
+        perMinute = headers.get('X-RateLimit-Remaining-Minute')
+        retryAfter = headers.get('Retry-After')
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if remaining is not None and remaining.strip().isdigit():
+                self.remaining = int(remaining)
+                if self.resetAt is None:
+                    self.resetAt = now + 3600  # at the latest
+            if perMinute is not None and perMinute.strip() == '0':
+                self.pausedUntil = max(self.pausedUntil, now + 60)
+            if retryAfter is not None and retryAfter.strip().isdigit():
+                self.pausedUntil = max(self.pausedUntil,
+                                       now + int(retryAfter))
+            elif limited:
+                self.pausedUntil = max(self.pausedUntil, now + 60)
+
+    def stats(self):
+        """Return a dictionary of the budget and counters."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return {'tokens': self.tokens,
+                    'remaining': self.remaining,
+                    'granted': self.granted,
+                    'deferred': self.deferred,
+                    'dropped': self.dropped}
+
+
+class BodyDecoder:
+    """Decompress a response body one chunk at a time.
+
+    `contentEncoding` is the response's Content-Encoding header. Anything
+    other than gzip or deflate is passed through unchanged."""
+
+    def __init__(self, contentEncoding):
+        self.contentEncoding = contentEncoding.strip().lower()
+        self.received = 0
+        if self.contentEncoding in ('gzip', 'x-gzip'):
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.contentEncoding == 'deflate':
+            self._decoder = zlib.decompressobj()
+        else:
+            self._decoder = None
+
+    def decode(self, chunk):
+        """Return the decompressed data of the next chunk."""
+        if self._decoder:
+            try:
+                decoded = self._decoder.decompress(chunk)
+            except zlib.error:
+                if self.received or self.contentEncoding != 'deflate':
+                    raise
+                # Some servers send raw deflate data without the zlib
+                # header that the standard asks for.
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                decoded = self._decoder.decompress(chunk)
+        else:
+            decoded = chunk
+        self.received += len(chunk)
+        return decoded
+
+    def flush(self):
+        """Return any data left in the decompressor."""
+        return self._decoder.flush() if self._decoder else b''
+
+
+def isServerFailure(error):
+    """Return True if an error means the server is unhealthy.
+
+    Client errors, like 404 for an unknown word, mean the server is fine."""
+    return (not isinstance(error, urllib.error.HTTPError)
+            or error.code >= 500)
+
+
+class SingleFlight:
+    """Share one call between everyone who asks for the same key at once.
+
+    While a call for a key is running, later callers with that key wait for
+    it and get the same result or exception instead of starting their own.
+    Once it's finished, the next call for the key runs again."""
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._calls = {}  # key: [threading.Event, result, exception]
+        self._tasks = {}  # key: asyncio.Task
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Return function(), or the result of the running call for key."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = [threading.Event(), None, None]
+                self.calls += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        event = call[0]
+        if leader:
+            try:
+                call[1] = function()
+            except Exception as e:
+                call[2] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                event.set()
+        else:
+            event.wait()
+        if call[2] is not None:
+            raise call[2]
+        return call[1]
+
+    async def doAsync(self, key, coroutineFunction):
+        """Await coroutineFunction(), sharing it like do().
+
+        The call runs in its own task, so it isn't cancelled when one of the
+        callers waiting for it is."""
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                task = asyncio.ensure_future(coroutineFunction())
+                self._tasks[key] = task
+                task.add_done_callback(
+                    lambda task: self._tasks.pop(key, None))
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """Return a dictionary of the counters."""
+        with self._lock:
+            inFlight = len(self._calls) + len(self._tasks)
+        return {'calls': self.calls,
+                'coalesced': self.coalesced,
+                'inFlight': inFlight}
+
+
 class ApiClient:
     """Generic API client for Swagger client library builds"""
 
-    def __init__(self, apiKey=None, apiServer=None):
+    def __init__(self, apiKey=None, apiServer=None, pool=None):
         if apiKey == None:
             raise Exception('You must pass an apiKey when instantiating the '
                             'APIClient')
         self.apiKey = apiKey
         self.apiServer = apiServer
         self.cookie = None
+        self.pool = pool or ConnectionPool()
+        self.breaker = CircuitBreaker()
+        # GETs are retried this many times after a server failure, waiting a
+        # random time of up to retryDelay * 2 ** attempt seconds first
+        self.maxRetries = 2
+        self.retryDelay = 0.25
+        # Response body sizes, before and after decompression
+        self.bytesReceived = 0
+        self.bytesDecoded = 0
+        self._counterLock = threading.Lock()
+        # An optional cache of GET responses, with get(key, default, stale)
+        # and put(key, value) methods, like cache.DiskCache, and the
+        # patterns of the endpoints it's used for (see cacheEndpoint)
+        self.cache = None
+        self.cachedEndpoints = []
+        # Identical GETs that are sent at the same time share one request.
+        self.singleFlight = SingleFlight()
+        # An optional RateLimiter that every request waits for
+        self.limiter = None
 
     def callAPI(self, resourcePath, method, queryParams, postData,
                 headerParams=None):
 
+        url, headers, data = self.prepareRequest(resourcePath, method,
+                                                 queryParams, postData,
+                                                 headerParams)
+        if method != 'GET':
+            return self.fetch(method, url, headers, data)
+        cacheKey = self.cacheKey(resourcePath, url, headerParams)
+        return self.singleFlight.do(
+            self.flightKey(url, headerParams),
+            lambda: self.fetch(method, url, headers, data, cacheKey))
+
+    def cacheEndpoint(self, resourcePath):
+        """Cache the GET responses of an endpoint.
+
+        `resourcePath` is written like it is in the API classes, such as
+        '/word.json/{word}/definitions'. Only the endpoints added here are
+        cached, since some GETs, like a random word, change every time."""
+
+        pattern = re.sub(r'\\\{\w+\\\}', '[^/]+', re.escape(resourcePath))
+        self.cachedEndpoints.append(re.compile(pattern + '$'))
+
+    def cacheKey(self, resourcePath, url, headerParams):
+        """Return the cache key of a GET, or None if it isn't cached.
+
+        The URL doesn't include the API key, so it's safe to store. Header
+        parameters, like an auth token, are only stored as a hash."""
+
+        if self.cache is None or not any(
+                pattern.match(resourcePath)
+                for pattern in self.cachedEndpoints):
+            return None
+        if not headerParams:
+            return url
+        headerText = json.dumps(sorted(headerParams.items()))
+        return url + '#' + hashlib.sha256(
+            headerText.encode('utf-8')).hexdigest()
+
+    def flightKey(self, url, headerParams):
+        """Return the key that identical requests share.
+
+        The URL holds the endpoint and the sorted query parameters. The
+        priority is part of it too, so an interactive request never waits
+        on a background one that the rate limiter is holding back."""
+        return (requestPriority.get(), url,
+                tuple(sorted((headerParams or {}).items())))
+
+    def fetch(self, method, url, headers, data, cacheKey=None):
+        """Send a prepared request, using the cache if there's a key."""
+
+        if cacheKey:
+            cached = self.cache.get(cacheKey)
+            if cached is not None:
+                return cached
+
+        # Make the request
+        try:
+            request, body = self.sendWithRetries(method, url, headers, data)
+        except urllib.error.URLError:
+            # Serve an expired response rather than nothing when offline.
+            if cacheKey:
+                cached = self.cache.get(cacheKey, stale=True)
+                if cached is not None:
+                    return cached
+            raise
+        data = self.decodeResponse(request.headers, body)
+
+        if cacheKey and data is not None:
+            self.cache.put(cacheKey, data)
+
+        return data
+
+    def prepareRequest(self, resourcePath, method, queryParams, postData,
+                       headerParams=None):
+        """Return the (url, headers, body) of a request."""
+
         url = self.apiServer + resourcePath
         headers = {}
         if headerParams:
@@ -51,7 +591,8 @@ class ApiClient:
                 for param, value in queryParams.items():
                     if value != None:
                         sentQueryParams[param] = value
-                url = url + '?' + urllib.parse.urlencode(sentQueryParams)
+                url = url + '?' + urllib.parse.urlencode(
+                    sorted(sentQueryParams.items()))
 
         elif method in ['POST', 'PUT', 'DELETE']:
 
@@ -66,22 +607,162 @@ class ApiClient:
         if data:
             data = data.encode('utf-8')
 
-        requestParams = MethodRequest(method=method, url=url,
-                                       headers=headers, data=data)
+        return url, headers, data
 
-        # Make the request
-        request = urllib.request.urlopen(requestParams)
-        encoding = request.headers.get_content_charset()
+    def decodeResponse(self, responseHeaders, body):
+        """Parse a response body as JSON, or return None if it's empty."""
+
+        encoding = responseHeaders.get_content_charset()
         if not encoding:
             encoding = 'utf-8'
-        response = request.read().decode(encoding)
+        response = body.decode(encoding)
 
         try:
-            data = json.loads(response)
+            return json.loads(response)
         except ValueError:  # PUT requests don't return anything
-            data = None
+            return None
 
-        return data
+    def checkBreaker(self):
+        """Raise CircuitOpenError if requests shouldn't be sent now."""
+
+        if not self.breaker.allow():
+            raise CircuitOpenError('%s is unavailable, retrying in %d seconds'
+                                   % (self.apiServer,
+                                      math.ceil(self.breaker.retryAfter())))
+
+    def sendWithRetries(self, method, url, headers, data):
+        """Send a request, retrying GETs and tracking the server's health.
+
+        Only GETs are retried, since they're safe to repeat. Raises
+        CircuitOpenError without sending anything while the circuit breaker
+        is open, and RateLimitError if the limiter won't let it through."""
+
+        if self.limiter:
+            self.startRateLimitSync()
+            self.limiter.acquire(requestPriority.get())
+        self.checkBreaker()
+        attempt = 0
+        while True:
+            try:
+                result = self.sendRequest(method, url, headers, data)
+            except urllib.error.URLError as e:
+                self.observeRateLimit(e)
+                if not isServerFailure(e):
+                    self.breaker.recordSuccess()
+                    raise
+                if method == 'GET' and attempt < self.maxRetries:
+                    # Jitter keeps the threads from retrying all at once.
+                    delay = self.retryDelay * 2 ** attempt
+                    time.sleep(random.uniform(0, delay))
+                    attempt += 1
+                    continue
+                self.breaker.recordFailure()
+                raise
+            except Exception:
+                self.breaker.recordFailure()
+                raise
+            self.breaker.recordSuccess()
+            self.observeRateLimit(result[0])
+            return result
+
+    def observeRateLimit(self, response):
+        """Update the rate limiter from a response or HTTPError's headers."""
+
+        headers = getattr(response, 'headers', None)
+        if self.limiter and headers is not None:
+            self.limiter.observe(headers,
+                                 getattr(response, 'code', None) == 429)
+
+    def startRateLimitSync(self):
+        """Fetch the ApiTokenStatus in a thread, if it's time to."""
+
+        if self.limiter.needsSync():
+            threading.Thread(target=self.syncRateLimit, daemon=True).start()
+
+    def syncRateLimit(self):
+        """Update the rate limiter from the key's ApiTokenStatus.
+
+        The request skips the limiter, the cache and the retries."""
+
+        url, headers, data = self.prepareRequest(
+            '/account.json/apiTokenStatus', 'GET', {}, None)
+        try:
+            response, body = self.sendRequest('GET', url, headers, data)
+        except urllib.error.URLError:
+            return
+        status = self.decodeResponse(response.headers, body)
+        if status:
+            status = self.deserialize(status, 'ApiTokenStatus')
+            self.limiter.sync(status.remainingCalls, status.resetsInMillis)
+
+    def sendRequest(self, method, url, headers, data):
+        """Send a request over a pooled connection.
+
+        Returns the response and its body. Like `urllib.request.urlopen`,
+        this raises HTTPError for error statuses, and URLError if the server
+        can't be reached."""
+
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        headers = dict(headers, **{'Accept-Encoding': 'gzip, deflate'})
+        while True:
+            connection, reused = self.pool.getConnection(parts.scheme,
+                                                         parts.netloc)
+            try:
+                if connection.sock is None:
+                    self.pool.connect(connection)
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+                body = self.readBody(response)
+            except (http.client.HTTPException, OSError, zlib.error) as e:
+                connection.close()
+                # The server may have closed an idle connection. The request
+                # may have arrived anyway, so only GETs and HEADs are safe
+                # to send again, on a new connection.
+                if (reused and method in ('GET', 'HEAD')
+                        and isinstance(e, (http.client.RemoteDisconnected,
+                                           ConnectionResetError,
+                                           BrokenPipeError))):
+                    continue
+                raise urllib.error.URLError(e)
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.releaseConnection(parts.scheme, parts.netloc,
+                                        connection)
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status,
+                                         response.reason, response.headers,
+                                         io.BytesIO(body))
+        return response, body
+
+    def readBody(self, response):
+        """Read a response body, decompressing it as it arrives.
+
+        Bodies sent with gzip or deflate Content-Encoding are decompressed a
+        chunk at a time, so the compressed and decompressed copies are never
+        both held in full."""
+
+        decoder = BodyDecoder(response.getheader('Content-Encoding', ''))
+        chunks = []
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(decoder.decode(chunk))
+        chunks.append(decoder.flush())
+        body = b''.join(chunks)
+        self.countBytes(decoder.received, len(body))
+        return body
+
+    def countBytes(self, received, decoded):
+        """Add to the counts of body bytes received and decoded."""
+
+        with self._counterLock:
+            self.bytesReceived += received
+            self.bytesDecoded += decoded
 
     def toPathValue(self, obj):
         """Convert a string or object to a path-friendly value
@@ -179,20 +860,3 @@ class ApiClient:
                                                              objClass))
 
         return instance
-
-
-class MethodRequest(urllib.request.Request):
-
-    def __init__(self, *args, **kwargs):
-        """Construct a MethodRequest. Usage is the same as for
-        `urllib.Request` except it also takes an optional `method`
-        keyword argument. If supplied, `method` will be used instead of
-        the default."""
-
-        if 'method' in kwargs:
-            self.method = kwargs.pop('method')
-        return urllib.request.Request.__init__(self, *args, **kwargs)
-
-    def get_method(self):
-        return getattr(self, 'method', urllib.request.Request.get_method(self))
-